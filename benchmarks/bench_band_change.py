@@ -0,0 +1,214 @@
+# Licence: Attribution-NonCommercial-ShareAlike 4.0 International (CC BY-NC-SA 4.0) Written by ZapWizard (Joshua Driggs)
+
+# Benchmark: Main loop passes while band changes play their callouts
+# select_band() used to wait for the band callout to finish, stopping UART, heartbeats and tuning for its whole length.
+# This runs the main loop through several band changes with the mixer stubbed, so no audio hardware is needed,
+# and fails if any band change or loop pass takes longer than the budget.
+# Needs the radio's requirements installed, the Pi Pico and the UART are not used.
+# Usage: python3 benchmarks/bench_band_change.py [--changes 6] [--callout 1.5] [--budget 0.05]
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["SDL_VIDEODRIVER"] = "dummy"
+os.environ["SDL_AUDIODRIVER"] = "dummy"  # main.py opens the mixer when it is imported
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pygame
+import library
+import settings
+import setup
+setup.initialize = lambda: None  # main.py mounts the Pi Pico and opens the UART when it is imported
+import main
+
+
+class StubSound:
+    def __init__(self, length):
+        self.length = length
+
+    def get_length(self):
+        return self.length
+
+
+class StubChannel:
+    """
+    Plays a sound for its length, then posts the end event like a mixer channel.
+    """
+
+    def __init__(self):
+        self.end_time = None
+        self.end_event = None
+
+    def play(self, sound, loops=0):
+        self.end_time = time.time() + sound.get_length()
+
+    def stop(self):
+        if self.end_time is not None:
+            self.end_time = time.time()
+
+    def get_busy(self):
+        return self.end_time is not None and time.time() < self.end_time
+
+    def set_volume(self, *volume):
+        pass
+
+    def set_endevent(self, event_type=None):
+        self.end_event = event_type
+
+    def update(self):
+        if self.end_time is not None and time.time() >= self.end_time:
+            self.end_time = None
+            if self.end_event:
+                pygame.event.post(pygame.event.Event(self.end_event))
+
+
+class StubMusic:
+    # Songs are long enough not to end during the benchmark
+    def __init__(self):
+        self.start_time = None
+        self.end_event = None
+
+    def load(self, file_path):
+        self.start_time = None
+
+    def play(self, loops=0, start=0.0):
+        self.start_time = time.time()
+
+    def queue(self, file_path):
+        pass
+
+    def stop(self):
+        self.start_time = None
+
+    def pause(self):
+        pass
+
+    def unpause(self):
+        pass
+
+    def set_volume(self, volume):
+        pass
+
+    def get_busy(self):
+        return self.start_time is not None
+
+    def get_pos(self):
+        return int((time.time() - self.start_time) * 1000) if self.start_time is not None else -1
+
+    def set_endevent(self, event_type=None):
+        self.end_event = event_type
+
+
+class StubMixer:
+    """
+    The parts of pygame.mixer the radio uses. Decoding takes no time, every sound lasts callout_length seconds.
+    """
+
+    def __init__(self, callout_length):
+        self.callout_length = callout_length
+        self.channels = {}
+        self.music = StubMusic()
+
+    def Sound(self, file_path=None, **kwargs):
+        return StubSound(self.callout_length)
+
+    def Channel(self, channel_number):
+        return self.channels.setdefault(channel_number, StubChannel())
+
+    def get_init(self):
+        return settings.AUDIO_SETTINGS["frequency"], settings.AUDIO_SETTINGS["size"], settings.AUDIO_SETTINGS["channels"]
+
+    def update(self):
+        # What the SDL audio thread does between loop passes
+        for channel in self.channels.values():
+            channel.update()
+
+
+def make_bands(radio_folder, band_count, station_count):
+    # Loaded bands with a callout file each, the song files are never opened
+    radio_bands = []
+    for band_number in range(band_count):
+        folder_name = f"{band_number:02d}_band"
+        os.makedirs(os.path.join(radio_folder, folder_name))
+        open(os.path.join(radio_folder, folder_name, settings.BAND_CALLOUT_SETTINGS["file"]), "wb").close()
+        stations = []
+        for station_number in range(station_count):
+            path = os.path.join(radio_folder, folder_name, f"{station_number:02d}_station")
+            station_data = library.get_default_station_data(path, os.path.basename(path), folder_name)
+            station_data.update({
+                "station_files": [os.path.join(path, f"{song_number:03d}.ogg") for song_number in range(20)],
+                "station_lengths": [180.0 + song_number for song_number in range(20)],
+            })
+            station_data["total_length"] = sum(station_data["station_lengths"])
+            stations.append(library.compact_station_data(station_data))
+        radio_bands.append({"folder_name": folder_name, "stations": stations, "loaded": True})
+    return radio_bands
+
+
+def main_loop_pass(mixer):
+    # The work of one pass of run(), without the UART and the sleep
+    mixer.update()
+    start = time.perf_counter()
+    main.service_radio(time.time())
+    return time.perf_counter() - start
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description="Check main loop stalls during band changes")
+    parser.add_argument("--changes", type=int, default=6)
+    parser.add_argument("--callout", type=float, default=1.5, help="Callout length in seconds")
+    parser.add_argument("--budget", type=float, default=settings.LOOP_STALL_WARNING, help="Longest allowed pass in seconds")
+    args = parser.parse_args()
+
+    mixer = StubMixer(args.callout)
+    pygame.mixer = mixer  # main and sound_cache look the mixer up on the pygame module
+    main.send_uart = lambda *args, **kwargs: None
+    settings.BAND_CALLOUT_SETTINGS["enabled"] = True
+    settings.BAND_CALLOUT_SETTINGS["wait_for_completion"] = True
+
+    with tempfile.TemporaryDirectory() as radio_folder:
+        settings.STATIONS_ROOT_FOLDER = radio_folder
+        main.radio_band_list = make_bands(radio_folder, 3, 8)
+        main.radio_band_total = len(main.radio_band_list)
+        main.static_sounds = {0: StubSound(5)}
+        main.large_static_files = []
+        main.on_off_state = True
+
+        band_change_times = []
+        pass_times = []
+        callout_passes = []
+        for change in range(args.changes):
+            # What next_band() does, the station waits for the callout
+            start = time.perf_counter()
+            main.select_band(change % main.radio_band_total)
+            main.select_station(main.get_nearest_station(main.motor_angle), True)
+            band_change_times.append(time.perf_counter() - start)
+            assert main.callout_active, "The band callout didn't start"
+            assert main.pending_station is not None, "The station didn't wait for the callout"
+
+            passes = 0
+            deadline = time.time() + args.callout + 2
+            while main.callout_active and time.time() < deadline:
+                pass_times.append(main_loop_pass(mixer))
+                passes += 1
+                time.sleep(0.005)
+            assert not main.callout_active, "The callout end event didn't finish the band change"
+            pass_times.append(main_loop_pass(mixer))  # Starts the station
+            assert main.active_station is not None, "No station was started after the callout"
+            callout_passes.append(passes)
+
+    worst_change = max(band_change_times)
+    worst_pass = max(pass_times)
+    print(f"Band changes:     {args.changes}, callout {args.callout} s")
+    print(f"Band change call: worst {worst_change * 1000:.2f} ms")
+    print(f"Loop passes:      {len(pass_times)}, worst {worst_pass * 1000:.2f} ms, average {sum(pass_times) / len(pass_times) * 1000:.3f} ms")
+    print(f"Passes per callout: {min(callout_passes)} to {max(callout_passes)}, the loop kept running while each callout played")
+    assert worst_change < args.budget, f"A band change took {worst_change * 1000:.1f} ms, budget {args.budget * 1000:.1f} ms"
+    assert worst_pass < args.budget, f"A loop pass took {worst_pass * 1000:.1f} ms, budget {args.budget * 1000:.1f} ms"
+    print(f"OK: Every band change and loop pass stayed under {args.budget * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main_benchmark()
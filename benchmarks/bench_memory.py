@@ -0,0 +1,80 @@
+# Licence: Attribution-NonCommercial-ShareAlike 4.0 International (CC BY-NC-SA 4.0) Written by ZapWizard (Joshua Driggs)
+
+# Benchmark: Resident memory of a large library
+# Writes a synthetic library index, loads it the way the radio does at boot and builds a timeline for every station,
+# reporting the resident memory added by each step. Linux only, it reads /proc/self/statm.
+# Usage: python3 benchmarks/bench_memory.py [--tracks 100000] [--bands 20] [--stations 50]
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import library
+from timeline import StationTimeline
+
+RADIO_FOLDER = "/home/pi/radio_king_radio/radio"
+
+
+def get_rss_mb():
+    gc.collect()
+    with open("/proc/self/statm") as file:
+        return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def write_index(index_file, tracks, bands, stations):
+    files_per_station = max(tracks // (bands * stations), 1)
+    index = {"version": library.LIBRARY_INDEX_VERSION, "bands": []}
+    for band_number in range(bands):
+        band_name = f"{band_number:02d}_Band Name"
+        band = {"folder_name": band_name, "stations": []}
+        for station_number in range(stations):
+            station_name = f"{station_number:02d}_Station Name"
+            path = os.path.join(band_name, station_name)
+            station_lengths = [180.5 + file_number for file_number in range(files_per_station)]
+            band["stations"].append({
+                "path": path,
+                "station_name": station_name,
+                "folder_name": band_name,
+                "station_files": [os.path.join(path, f"{file_number:03d} - Artist Name - Song Title.ogg") for file_number in range(files_per_station)],
+                "station_ordered": False,
+                "station_lengths": station_lengths,
+                "station_fingerprints": [[4000000 + file_number, 1700000000000000000 + file_number, 1000000 + file_number] for file_number in range(files_per_station)],
+                "total_length": sum(station_lengths),
+                "station_start": 0,
+                "ini_mtime_ns": 1700000000000000000,
+            })
+        index["bands"].append(band)
+    with open(index_file, "w") as file:
+        json.dump(index, file)
+    return bands * stations * files_per_station
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the resident memory of a large library")
+    parser.add_argument("--tracks", type=int, default=100000)
+    parser.add_argument("--bands", type=int, default=20)
+    parser.add_argument("--stations", type=int, default=50, help="Stations per band")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_folder:
+        index_file = os.path.join(temp_folder, "library.json")
+        track_count = write_index(index_file, args.tracks, args.bands, args.stations)
+
+        start_rss = get_rss_mb()
+        library_index = library.load_library_index(index_file, RADIO_FOLDER)
+        index_rss = get_rss_mb()
+        timelines = [station_data.get("timeline") or StationTimeline(station_data["station_lengths"])
+                     for band in library_index["bands"] for station_data in band["stations"]]
+        timeline_rss = get_rss_mb()
+
+    print(f"Library: {track_count} tracks in {len(timelines)} stations")
+    print(f"Loaded index:  {index_rss - start_rss:.1f} MB, {(index_rss - start_rss) * 2 ** 20 / track_count:.0f} bytes per track")
+    print(f"Timelines:     {timeline_rss - index_rss:.1f} MB, {(timeline_rss - index_rss) * 2 ** 20 / track_count:.0f} bytes per track")
+    print(f"Total:         {timeline_rss - start_rss:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
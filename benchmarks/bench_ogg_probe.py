@@ -0,0 +1,99 @@
+# Licence: Attribution-NonCommercial-ShareAlike 4.0 International (CC BY-NC-SA 4.0) Written by ZapWizard (Joshua Driggs)
+
+# Benchmark: Native Ogg length probe vs mutagen
+# Builds a library of a few thousand .ogg files by copying the test station files, then times both length readers.
+# Usage: python3 benchmarks/bench_ogg_probe.py [--files 3000] [--source radio/99_test_stations]
+import argparse
+import builtins
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import library
+
+
+class CountingFile:
+    """Wraps a file object and counts the bytes read through it."""
+    bytes_read = 0
+
+    def __init__(self, file):
+        self.file = file
+
+    def read(self, *args):
+        data = self.file.read(*args)
+        CountingFile.bytes_read += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.file.close()
+
+
+def counting_open(*args, **kwargs):
+    return CountingFile(builtins.open(*args, **kwargs))
+
+
+def build_library(source_folder, file_count, target_folder):
+    source_files = []
+    for root, _, files in os.walk(source_folder):
+        source_files.extend(os.path.join(root, name) for name in files if name.endswith(".ogg"))
+    if not source_files:
+        sys.exit(f"No .ogg files found in {source_folder}")
+    source_files.sort()
+    library_files = []
+    for number in range(file_count):
+        file_path = os.path.join(target_folder, f"{number:05d}.ogg")
+        shutil.copyfile(source_files[number % len(source_files)], file_path)
+        library_files.append(file_path)
+    return library_files
+
+
+def time_probe(name, probe, files):
+    CountingFile.bytes_read = 0
+    start = time.perf_counter()
+    lengths = [probe(file_path) for file_path in files]
+    elapsed = time.perf_counter() - start
+    result = f"{name:>8}: {elapsed:.3f} s total, {elapsed / len(files) * 1e6:.1f} us per file"
+    if CountingFile.bytes_read:
+        result += f", {CountingFile.bytes_read / len(files) / 1024:.1f} KB read per file"
+    print(result)
+    return lengths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the native Ogg length probe against mutagen")
+    parser.add_argument("--files", type=int, default=3000, help="Number of files in the generated library")
+    parser.add_argument("--source", default="radio/99_test_stations", help="Folder of .ogg files to copy from")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as target_folder:
+        files = build_library(args.source, args.files, target_folder)
+        total_size = sum(os.path.getsize(file_path) for file_path in files)
+        print(f"Library: {len(files)} files, {total_size / len(files) / 1024:.1f} KB average size")
+
+        # Only the native reader opens files through library.open, so only its reads are counted
+        library.open = counting_open
+        native_lengths = time_probe("native", library.get_audio_length_ogg, files)
+        del library.open
+        try:
+            import mutagen
+        except ImportError:
+            print(" mutagen: not installed, skipped")
+            return
+        mutagen_lengths = time_probe("mutagen", library.get_audio_length_mutagen, files)
+
+        mismatches = sum(1 for a, b in zip(native_lengths, mutagen_lengths) if abs(a - b) > 1e-6)
+        print(f"Length mismatches between the two readers: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
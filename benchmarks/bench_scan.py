@@ -0,0 +1,127 @@
+# Licence: Attribution-NonCommercial-ShareAlike 4.0 International (CC BY-NC-SA 4.0) Written by ZapWizard (Joshua Driggs)
+
+# Benchmark: Station folder listing, glob based pipeline vs the single pass scanner
+# Builds a tree of empty .ogg files and lists every station folder with both approaches,
+# counting directory listings and stat calls made through the os module.
+# Usage: python3 benchmarks/bench_scan.py [--bands 20] [--stations 25] [--files 100]
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import library
+
+call_counts = {"scandir": 0, "stat": 0}
+real_scandir = os.scandir
+real_stat = os.stat
+
+
+class CountingEntry:
+    """Wraps a DirEntry and counts stat calls, the first DirEntry.stat() is a system call on Linux."""
+
+    def __init__(self, entry):
+        self.entry = entry
+        self.stat_counted = False
+
+    def stat(self, *args, **kwargs):
+        if not self.stat_counted:
+            call_counts["stat"] += 1
+            self.stat_counted = True
+        return self.entry.stat(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.entry, name)
+
+    def __fspath__(self):
+        return self.entry.path
+
+
+class CountingScandir:
+    def __init__(self, *args, **kwargs):
+        call_counts["scandir"] += 1
+        self.iterator = real_scandir(*args, **kwargs)
+
+    def __iter__(self):
+        return (CountingEntry(entry) for entry in self.iterator)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.iterator.close()
+
+
+def counting_stat(*args, **kwargs):
+    call_counts["stat"] += 1
+    return real_stat(*args, **kwargs)
+
+
+def build_tree(radio_folder, bands, stations, files):
+    for band_number in range(bands):
+        for station_number in range(stations):
+            station_folder = os.path.join(radio_folder, f"{band_number:02d}_Band", f"{station_number:02d}_Station")
+            os.makedirs(station_folder)
+            for file_number in range(files):
+                open(os.path.join(station_folder, f"{file_number + 1} - Song {file_number}.ogg"), "wb").close()
+
+
+def list_station_folders(radio_folder):
+    return [station_folder.path for band_folder in os.scandir(radio_folder)
+            for station_folder in os.scandir(band_folder.path) if station_folder.is_dir()]
+
+
+def legacy_listing(station_folder):
+    # The folder check, glob, sort and per file stat done before the single pass scanner
+    if not library.has_valid_ogg_files(station_folder):
+        return []
+    station_files = sorted(glob.glob(os.path.join(station_folder, "*.ogg")), key=library.extract_number)
+    return [(file_path, library.get_file_fingerprint(os.stat(file_path), True)) for file_path in station_files]
+
+
+def single_pass_listing(station_folder):
+    return library.scan_station_folder(station_folder)
+
+
+def measure(name, listing, station_folders):
+    # Time without the counting wrappers, then count in a second pass
+    start = time.perf_counter()
+    for station_folder in station_folders:
+        listing(station_folder)
+    elapsed = time.perf_counter() - start
+
+    call_counts.update(scandir=0, stat=0)
+    os.scandir, os.stat = CountingScandir, counting_stat
+    try:
+        for station_folder in station_folders:
+            listing(station_folder)
+    finally:
+        os.scandir, os.stat = real_scandir, real_stat
+    print(f"{name:>12}: {elapsed:.3f} s, {call_counts['scandir']} directory listings, {call_counts['stat']} stat calls")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark station folder listing")
+    parser.add_argument("--bands", type=int, default=20)
+    parser.add_argument("--stations", type=int, default=25, help="Stations per band")
+    parser.add_argument("--files", type=int, default=100, help="Files per station")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as radio_folder:
+        build_tree(radio_folder, args.bands, args.stations, args.files)
+        station_folders = list_station_folders(radio_folder)
+        print(f"Tree: {len(station_folders)} station folders, {len(station_folders) * args.files} files")
+
+        # Warm the dentry and inode caches so both runs see the same conditions
+        for station_folder in station_folders:
+            single_pass_listing(station_folder)
+        legacy_time = measure("legacy", legacy_listing, station_folders)
+        single_pass_time = measure("single pass", single_pass_listing, station_folders)
+        print(f"Speed up: {legacy_time / single_pass_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# Licence: Attribution-NonCommercial-ShareAlike 4.0 International (CC BY-NC-SA 4.0) Written by ZapWizard (Joshua Driggs)
+
+# Benchmark: Finding the start page of a live position in a long Ogg file, decoder search vs seek table
+# Builds an hour long Ogg file from the header pages of a test station file and synthetic audio pages, then times
+# an interpolation search like libvorbisfile's against a seek table lookup at several offsets, with the file
+# dropped from the page cache before every seek. Page contents aren't decodable audio, only the page layout matters.
+# Usage: python3 benchmarks/bench_seek.py [--minutes 60] [--source radio/99_test_stations/01_Ordered/1.ogg]
+import argparse
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import library
+
+CHUNK_SIZE = 65536  # libvorbisfile reads this much per search step
+SAMPLES_PER_PAGE = 4096
+PAGE_BODY_SIZE = 4000  # Around 128 kbps at 44.1 kHz
+
+
+class CountingFile:
+    """Wraps a file object and counts reads and bytes read."""
+
+    def __init__(self, file):
+        self.file = file
+        self.reads = 0
+        self.bytes_read = 0
+
+    def read(self, *args):
+        data = self.file.read(*args)
+        self.reads += 1
+        self.bytes_read += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+def write_long_ogg(source_file, target_file, minutes):
+    with open(source_file, 'rb') as file:
+        head = file.read()
+    serial, sample_rate, pre_skip, header_packets = library.parse_ogg_identification(head)
+    audio_start = library.build_seek_table(source_file)["audio_start"]
+    page_count = int(minutes * 60 * sample_rate / SAMPLES_PER_PAGE)
+    body = bytes(random.getrandbits(8) for _ in range(PAGE_BODY_SIZE))
+    with open(target_file, 'wb') as file:
+        file.write(head[:audio_start])
+        for page_number in range(page_count):
+            lacing = bytes([250] * (PAGE_BODY_SIZE // 250))  # 16 packets, each ending on this page
+            header_type = 0x04 if page_number == page_count - 1 else 0
+            file.write(library.OGG_PAGE_HEADER.pack(b"OggS", 0, header_type, (page_number + 1) * SAMPLES_PER_PAGE,
+                                                    serial, page_number + 3, 0, len(lacing)))
+            file.write(lacing)
+            file.write(body)
+    return sample_rate
+
+
+def read_granule_after(file, position, serial):
+    """Returns (page offset, granule) of the first page of the stream at or after position, the way a decoder finds it."""
+    file.seek(position)
+    data = file.read(CHUNK_SIZE)
+    page_start = data.find(b"OggS")
+    while page_start >= 0 and page_start + library.OGG_PAGE_HEADER.size <= len(data):
+        fields = library.OGG_PAGE_HEADER.unpack_from(data, page_start)
+        if fields[4] == serial:
+            return position + page_start, fields[3]
+        page_start = data.find(b"OggS", page_start + 1)
+    return None, None
+
+
+def interpolation_search(file, target_sample, audio_start, file_size, total_samples, serial):
+    # Interpolation search over byte offsets like ov_pcm_seek_page, then read the first chunk of audio
+    begin, end = audio_start, file_size
+    begin_sample, end_sample = 0, total_samples
+    while end - begin > CHUNK_SIZE:
+        guess = begin + int((target_sample - begin_sample) * (end - begin) / max(end_sample - begin_sample, 1)) - CHUNK_SIZE
+        guess = min(max(guess, begin), end - CHUNK_SIZE)
+        page_offset, granule = read_granule_after(file, guess, serial)
+        if page_offset is None:
+            break
+        if granule < target_sample:
+            begin, begin_sample = page_offset + 1, granule
+        else:
+            end, end_sample = page_offset, granule
+            if page_offset <= guess + library.OGG_PAGE_HEADER.size:
+                break
+    file.seek(begin)
+    file.read(CHUNK_SIZE)
+
+
+def seek_table_start(file, seek_table, position):
+    # The decoder reads the header pages, then continues at the page from the seek table
+    start_time, offset = library.find_seek_entry(seek_table, position)
+    file.seek(0)
+    file.read(seek_table["audio_start"])
+    file.seek(offset)
+    file.read(CHUNK_SIZE)
+
+
+def drop_from_page_cache(file_path):
+    with open(file_path, 'rb') as file:
+        os.posix_fadvise(file.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def measure(function, file_path, *args):
+    drop_from_page_cache(file_path)
+    with open(file_path, 'rb') as raw_file:
+        file = CountingFile(raw_file)
+        start = time.perf_counter()
+        function(file, *args)
+        return time.perf_counter() - start, file.reads, file.bytes_read
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark seeking in a long Ogg file")
+    parser.add_argument("--minutes", type=float, default=60)
+    parser.add_argument("--source", default="radio/99_test_stations/01_Ordered/1.ogg", help="Ogg Vorbis file to take the header pages from")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_folder:
+        long_file = os.path.join(temp_folder, "long.ogg")
+        sample_rate = write_long_ogg(args.source, long_file, args.minutes)
+        file_size = os.path.getsize(long_file)
+
+        start = time.perf_counter()
+        seek_table = library.build_seek_table(long_file)
+        build_time = time.perf_counter() - start
+        serial = library.parse_ogg_identification(open(long_file, 'rb').read(library.OGG_HEAD_READ_SIZE))[0]
+        total_samples = int(args.minutes * 60 * sample_rate)
+        print(f"File: {round(file_size / 2 ** 20, 1)} MB, {args.minutes} minutes. Seek table: {len(seek_table['entries']) // 2} entries, "
+              f"built in {round(build_time, 2)} s")
+
+        # The page stream must hand the decoder the header pages followed by the chosen page
+        start_time, offset = library.find_seek_entry(seek_table, args.minutes * 30)
+        with library.OggPageStream(long_file, seek_table["audio_start"], offset) as stream:
+            stream.seek(seek_table["audio_start"])
+            assert stream.read(4) == b"OggS"
+
+        print(f"{'offset':>8} {'search ms':>10} {'reads':>6} {'KB':>6} {'table ms':>9} {'reads':>6} {'KB':>6}")
+        for fraction in (0.1, 0.25, 0.5, 0.75, 0.9):
+            position = args.minutes * 60 * fraction
+            search = measure(interpolation_search, long_file, int(position * sample_rate), seek_table["audio_start"], file_size, total_samples, serial)
+            table = measure(seek_table_start, long_file, seek_table, position)
+            print(f"{int(fraction * 100):>7}% {search[0] * 1000:>10.2f} {search[1]:>6} {search[2] // 1024:>6} "
+                  f"{table[0] * 1000:>9.2f} {table[1]:>6} {table[2] // 1024:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# Licence: Attribution-NonCommercial-ShareAlike 4.0 International (CC BY-NC-SA 4.0) Written by ZapWizard (Joshua Driggs)
+
+# Benchmark: Live position lookup, rotating deques vs the station timeline
+# Times a tune-in late in the day on a station of short songs, like the 1440 file time call station.
+# Usage: python3 benchmarks/bench_timeline.py [--songs 1440] [--length 60] [--hours 23.51]
+import argparse
+import os
+import sys
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from timeline import StationTimeline
+
+
+def rotate_to_position(files, song_lengths, position):
+    # The song walk live_playback did before the timeline
+    song_length = song_lengths[0]
+    while position > song_length:
+        files.rotate(-1)
+        song_lengths.rotate(-1)
+        position = position - song_length
+        song_length = song_lengths[0]
+    return files[0], position
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the live position lookup")
+    parser.add_argument("--songs", type=int, default=1440)
+    parser.add_argument("--length", type=float, default=60, help="Song length in seconds")
+    parser.add_argument("--hours", type=float, default=23.51, help="Time since midnight at tune-in")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    files = [f"{number:04d}.ogg" for number in range(args.songs)]
+    song_lengths = [args.length] * args.songs
+    position = args.hours * 3600
+
+    # Every tune-in starts from a fresh station, as after a band change
+    stations = [(deque(files), deque(song_lengths)) for _ in range(args.repeat)]
+    start = time.perf_counter()
+    for station_files, station_lengths in stations:
+        deque_result = rotate_to_position(station_files, station_lengths, position)
+    deque_time = (time.perf_counter() - start) / args.repeat
+
+    timeline = StationTimeline(song_lengths)
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        song_index, song_position = timeline.locate(position)
+    timeline_time = (time.perf_counter() - start) / args.repeat
+
+    assert deque_result[0] == files[song_index], (deque_result, files[song_index])
+    print(f"Station: {args.songs} songs, tune-in at {args.hours} h")
+    print(f"Rotating deques: {deque_time * 1e6:.1f} us per tune-in")
+    print(f"Timeline:        {timeline_time * 1e6:.1f} us per tune-in")
+    print(f"Speed up: {deque_time / timeline_time:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# Licence: Attribution-NonCommercial-ShareAlike 4.0 International (CC BY-NC-SA 4.0) Written by ZapWizard (Joshua Driggs)
+
+# Benchmark: Switching a station back to ordered playback
+# Compares restoring the canonical order from the station.ini [cache] section, as the radio used to,
+# with swapping in the in memory timeline and locating the live song.
+# Usage: python3 benchmarks/bench_toggle.py [--songs 1440] [--repeat 200]
+import argparse
+import configparser
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import library
+
+
+def order_from_station_ini(station_ini_file, elapsed_time):
+    # What order_station did before the library index: parse station.ini, decode the cache, rebuild and walk the deques
+    station_ini_parser = configparser.ConfigParser()
+    station_ini_parser.read(station_ini_file)
+    station_data = json.loads(station_ini_parser.get("cache", "station_data"))
+    files = deque(station_data["station_files"])
+    song_lengths = deque(station_data["station_lengths"])
+    position = elapsed_time % sum(song_lengths)
+    accumulated_length = 0
+    for index, length in enumerate(song_lengths):
+        if accumulated_length + length > position:
+            files.rotate(-index)
+            song_lengths.rotate(-index)
+            position -= accumulated_length
+            break
+        accumulated_length += length
+    return files[0], position
+
+
+def order_from_memory(station_data, elapsed_time):
+    # What order_station does now: the canonical timeline is already in memory
+    timeline = station_data["timeline"]
+    song_index, position = timeline.locate(elapsed_time)
+    return station_data["station_files"][song_index], position
+
+
+def time_calls(function, argument, elapsed_time, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function(argument, elapsed_time)
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark switching a station back to ordered playback")
+    parser.add_argument("--songs", type=int, default=1440)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    station_data = library.get_default_station_data("/home/pi/radio_king_radio/radio/99_Band/00_Station", "00_Station", "99_Band")
+    station_data["station_files"] = [os.path.join(station_data["path"], f"{number:04d}.ogg") for number in range(args.songs)]
+    station_data["station_lengths"] = [60.0 + number % 7 for number in range(args.songs)]
+    station_data["total_length"] = sum(station_data["station_lengths"])
+    elapsed_time = station_data["total_length"] * 0.9 + 0.5
+
+    with tempfile.TemporaryDirectory() as station_folder:
+        station_ini_file = os.path.join(station_folder, "station.ini")
+        station_ini_parser = configparser.ConfigParser()
+        station_ini_parser["cache"] = {"station_data": json.dumps(station_data)}
+        with open(station_ini_file, "w") as file:
+            station_ini_parser.write(file)
+        ini_time, ini_result = time_calls(order_from_station_ini, station_ini_file, elapsed_time, args.repeat)
+
+    library.compact_station_data(station_data)
+    memory_time, memory_result = time_calls(order_from_memory, station_data, elapsed_time, args.repeat)
+    assert ini_result[0] == memory_result[0], (ini_result, memory_result)
+
+    print(f"Station: {args.songs} songs")
+    print(f"From station.ini: {ini_time * 1e3:.3f} ms per toggle (page cache warm, SD card reads not included)")
+    print(f"From memory:      {memory_time * 1e3:.3f} ms per toggle")
+    print(f"Speed up: {ini_time / memory_time:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# Licence: Attribution-NonCommercial-ShareAlike 4.0 International (CC BY-NC-SA 4.0) Written by ZapWizard (Joshua Driggs)
+
+# Benchmark: One tuning tick, working out the nearest station and its distance vs indexing the band's tuning table
+# Usage: python3 benchmarks/bench_tuning.py [--stations 12] [--ticks 100000]
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import dial
+import settings
+
+
+def tick_computed(angle, total_station_num):
+    # What tuning() did on every tick before the table
+    nearest_station_num = dial.get_nearest_station(angle, total_station_num)
+    station_angle = dial.get_station_pos(nearest_station_num, total_station_num)
+    range_to_station = abs(station_angle - angle)
+    if range_to_station <= settings.TUNING_SETTINGS["lock_on"]:
+        zone = dial.LOCKED
+    elif range_to_station < settings.TUNING_SETTINGS["near"]:
+        zone = dial.NEAR
+    else:
+        zone = dial.STATIC
+    return nearest_station_num, range_to_station, zone
+
+
+def tick_table(angle, tuning_table):
+    return tuning_table[dial.get_table_index(tuning_table, angle)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark a tuning tick")
+    parser.add_argument("--stations", type=int, default=12)
+    parser.add_argument("--ticks", type=int, default=100000)
+    args = parser.parse_args()
+
+    # Angles as the Pi Pico sends them, rounded to 0.1 degrees
+    angles = [round(random.uniform(settings.MOTOR_SETTINGS["min_angle"], settings.MOTOR_SETTINGS["max_angle"]), 1) for _ in range(args.ticks)]
+
+    start = time.perf_counter()
+    tuning_table = dial.build_tuning_table(args.stations)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    computed = [tick_computed(angle, args.stations) for angle in angles]
+    computed_time = (time.perf_counter() - start) / args.ticks
+
+    start = time.perf_counter()
+    looked_up = [tick_table(angle, tuning_table) for angle in angles]
+    table_time = (time.perf_counter() - start) / args.ticks
+
+    assert computed == looked_up, "The table doesn't match the computed tuning"
+    print(f"Table: {len(tuning_table)} entries, built in {round(build_time * 1000, 2)} ms")
+    print(f"Computed: {round(computed_time * 1e6, 2)} us per tick")
+    print(f"Table:    {round(table_time * 1e6, 2)} us per tick, {round(computed_time / table_time, 1)}x faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# Licence: Attribution-NonCommercial-ShareAlike 4.0 International (CC BY-NC-SA 4.0) Written by ZapWizard (Joshua Driggs)
+
+# Benchmark: CSV lines vs binary frames between the Pi Zero and the Pi Pico
+# Parses a typical mix of motor, volume, button and heartbeat messages in both formats, then sends them through a
+# pseudo terminal pair to measure throughput. A pty isn't limited by a baud rate, so the message rate the frame
+# size allows at the UART baud rate is printed as well.
+# Usage: python3 benchmarks/bench_uart_protocol.py [--messages 20000] [--chunk 64]
+import argparse
+import os
+import select
+import sys
+import threading
+import time
+import tty
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pi_pico_files.uart_protocol import UartProtocol
+
+BAUD_RATE = 115200  # settings.UART_SETTINGS["baud_rate"]
+
+
+def make_messages(count):
+    messages = []
+    for number in range(count):
+        kind = number % 10
+        if kind < 6:
+            messages.append(("M", round(14 + number % 1540 / 10, 1)))
+        elif kind < 9:
+            messages.append(("V", round(number % 1000 / 1000, 3)))
+        elif number % 20 == 9:
+            messages.append(("B", "1", str(number % 5)))
+        else:
+            messages.append(("H", "Pico"))
+    return messages
+
+
+def parse_csv_lines(stream, chunk):
+    # What receive_uart did: split lines, decode and split each one
+    buffer = b""
+    messages = []
+    for start in range(0, len(stream), chunk):
+        buffer += stream[start:start + chunk]
+        *lines, buffer = buffer.split(b"\n")
+        messages.extend(line.decode("utf-8").split(",") for line in lines)
+    return messages
+
+
+def parse_protocol(stream, chunk):
+    protocol = UartProtocol()
+    messages = []
+    for start in range(0, len(stream), chunk):
+        messages.extend(protocol.feed(stream[start:start + chunk]))
+    return messages
+
+
+def measure_pty(stream, parse):
+    controller, device = os.openpty()
+    tty.setraw(device)
+    tty.setraw(controller)
+
+    def write_stream():
+        view = memoryview(stream)
+        while view:
+            written = os.write(controller, view[:4096])
+            view = view[written:]
+
+    writer = threading.Thread(target=write_stream, daemon=True)
+    start = time.perf_counter()
+    writer.start()
+    received = bytearray()
+    while len(received) < len(stream):
+        ready, _, _ = select.select([device], [], [], 1)
+        if not ready:
+            break
+        received += os.read(device, 4096)
+    messages = parse(bytes(received), 4096)
+    elapsed = time.perf_counter() - start
+    os.close(controller)
+    os.close(device)
+    return len(messages), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Pi Zero to Pi Pico message formats")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--chunk", type=int, default=64, help="Bytes handed to the parser at a time, like the serial reads")
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages)
+    csv_stream = b"".join(UartProtocol(binary=False).encode(*message) for message in messages)
+    encoder = UartProtocol()
+    encoder.peer_binary = True  # As after the Pi Pico's first heartbeat
+    binary_stream = b"".join(encoder.encode(*message) for message in messages)
+
+    results = {}
+    for name, stream, parse in (("CSV", csv_stream, parse_csv_lines), ("Binary", binary_stream, parse_protocol)):
+        start = time.perf_counter()
+        parsed = parse(stream, args.chunk)
+        parse_time = (time.perf_counter() - start) / args.messages
+        assert len(parsed) == args.messages, f"{name}: parsed {len(parsed)} of {args.messages} messages"
+        results[name] = parsed
+        count, elapsed = measure_pty(stream, parse)
+        bytes_per_message = len(stream) / args.messages
+        print(f"{name:>6}: {bytes_per_message:5.1f} bytes per message, parse {parse_time * 1e6:5.2f} us per message, "
+              f"pty {count / elapsed:9.0f} messages/s, {round(BAUD_RATE / 10 / bytes_per_message)} messages/s at {BAUD_RATE} baud")
+
+    # Both formats give the handlers the same fields, apart from the CSV padding
+    for csv_message, binary_message in zip(results["CSV"], results["Binary"]):
+        stripped = csv_message[:-1]
+        while stripped and not stripped[-1]:
+            stripped.pop()
+        assert [float(field) if field.replace(".", "", 1).isdigit() else field for field in stripped] == \
+               [float(field) if field.replace(".", "", 1).isdigit() else field for field in binary_message], (csv_message, binary_message)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# Licence: Attribution-NonCommercial-ShareAlike 4.0 International (CC BY-NC-SA 4.0) Written by ZapWizard (Joshua Driggs)
+
+# Dial layout
+# Stations are spread evenly across the dial between the end zones. The tuning table holds the result of the
+# station and distance math for every angle the Pi Pico can report, so a tuning tick is a single list index.
+import functools
+
+import settings
+
+# Tuning zones
+LOCKED = 0  # Close enough to play the station in the clear
+NEAR = 1  # Station plays quieter, with static
+STATIC = 2  # Only static
+
+
+def map_range(x, in_min, in_max, out_min, out_max):
+    if in_max <= 0 or in_max == in_min:
+        in_max = in_min + 0.001
+    if out_min <= out_max:
+        return max(min((x-in_min) * (out_max - out_min) / (in_max-in_min) + out_min, out_max), out_min)
+    else:
+        return min(max((x-in_min) * (out_max - out_min) / (in_max-in_min) + out_min, out_max), out_min)
+
+
+# Find the angular location of a radio station
+def get_station_pos(station_number, total_station_num):
+    # Validate total_station_num
+    if total_station_num <= 1:
+        raise ValueError(f"Invalid total_station_num: {total_station_num}. Must be greater than 1.")
+
+    # Validate station_number
+    if station_number < 0 or station_number >= total_station_num:
+        raise ValueError(f"Invalid station_number: {station_number}. Must be in range 0 to {total_station_num - 1}.")
+
+    # Cache settings for clarity
+    min_angle = settings.MOTOR_SETTINGS["min_angle"]
+    max_angle = settings.MOTOR_SETTINGS["max_angle"]
+    end_zone = settings.TUNING_SETTINGS["end_zone"]
+
+    # Calculate and return the angular position
+    return round(
+        map_range(
+            station_number,
+            0, total_station_num - 1,
+            min_angle + end_zone,
+            max_angle - end_zone,
+        ),
+        1,
+    )
+
+
+# Determine the nearest radio station to a certain motor angle
+def get_nearest_station(angle, total_station_num):
+    # Validate total_station_num
+    if total_station_num <= 1:
+        raise ValueError(f"Invalid total_station_num: {total_station_num}. Must be greater than 1.")
+
+    # Cache settings for clarity
+    min_angle = settings.MOTOR_SETTINGS["min_angle"]
+    max_angle = settings.MOTOR_SETTINGS["max_angle"]
+    end_zone = settings.TUNING_SETTINGS["end_zone"]
+
+    # Map the angle to the nearest station index and return
+    return round(
+        map_range(
+            angle,
+            min_angle + end_zone,
+            max_angle - end_zone,
+            0,
+            total_station_num - 1,
+        )
+    )
+
+
+def get_tuning(angle, total_station_num):
+    """
+    Returns (nearest station, distance to it, tuning zone) for a needle angle.
+    """
+    nearest_station_num = get_nearest_station(angle, total_station_num)
+    range_to_station = abs(get_station_pos(nearest_station_num, total_station_num) - angle)
+    if range_to_station <= settings.TUNING_SETTINGS["lock_on"]:
+        return nearest_station_num, range_to_station, LOCKED
+    elif range_to_station < settings.TUNING_SETTINGS["near"]:
+        return nearest_station_num, range_to_station, NEAR
+    return nearest_station_num, range_to_station, STATIC
+
+
+@functools.lru_cache(maxsize=8)
+def build_tuning_table(total_station_num):
+    """
+    get_tuning() for every angle step from 0 to 180 degrees, index it with get_table_index().
+    The table only depends on the number of stations, bands with the same number share it.
+    """
+    step = settings.TUNING_SETTINGS["table_step"]
+    # Angles are rounded the same way as the Pi Pico rounds them, so the distances match the ones sent over UART
+    return [get_tuning(round(index * step, 3), total_station_num) for index in range(round(180 / step) + 1)]
+
+
+def get_table_index(tuning_table, angle):
+    return min(max(round(angle / settings.TUNING_SETTINGS["table_step"]), 0), len(tuning_table) - 1)
@@ -0,0 +1,50 @@
+# Licence: Attribution-NonCommercial-ShareAlike 4.0 International (CC BY-NC-SA 4.0) Written by ZapWizard (Joshua Driggs)
+
+#!/usr/bin/python3
+# Offline library indexer
+# Builds the library index for an SD card's radio folder on a desktop computer, using every CPU core.
+# The index stores paths relative to the radio folder, so the Pi Zero can boot from it without probing any files.
+# Usage: python3 indexer.py /media/<user>/rootfs/home/pi/radio_king_radio/radio [--workers 8] [--full]
+import argparse
+import concurrent.futures
+import os
+import sys
+import time
+import library
+import settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the Radiation King library index on a desktop computer")
+    parser.add_argument("radio_folder", nargs="?", default=settings.STATIONS_ROOT_FOLDER,
+                        help="The radio folder holding the band folders (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Number of worker processes (default: %(default)s)")
+    parser.add_argument("--full", action="store_true",
+                        help="Ignore the existing index and probe every file again")
+    parser.add_argument("--no-seek-tables", action="store_true",
+                        help="Don't build seek tables for long files")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.radio_folder):
+        sys.exit(f"ERROR: {args.radio_folder} is not a folder")
+    index_file = os.path.join(args.radio_folder, os.path.basename(settings.LIBRARY_INDEX_FILE))
+
+    start_time = time.time()
+    print(f"Indexer: Scanning {args.radio_folder} with {args.workers} worker processes")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as executor:
+        # Every station is rescanned so the files are checked, unchanged files keep their cached length
+        radio_bands = library.get_radio_bands(args.radio_folder, index_file, executor, force_rescan=True,
+                                              use_index=not args.full, with_inode=False,
+                                              build_seek_tables=not args.no_seek_tables)
+
+    station_count = sum(len(band["stations"]) for band in radio_bands)
+    file_count = sum(len(station_data["station_files"]) for band in radio_bands for station_data in band["stations"])
+    seek_table_count = sum(len(station_data.get("seek_tables", {})) for band in radio_bands for station_data in band["stations"])
+    print(f"Indexer: {len(radio_bands)} bands, {station_count} stations, {file_count} files, {seek_table_count} seek tables "
+          f"indexed in {round(time.time() - start_time, 1)} s")
+    print(f"Indexer: Saved to {index_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,877 @@
+# Licence: Attribution-NonCommercial-ShareAlike 4.0 International (CC BY-NC-SA 4.0) Written by ZapWizard (Joshua Driggs)
+
+# Music library scanning and the library index
+# The index is a single file under the radio folder that holds every band, station, file, length and setting.
+# It is loaded with one read at boot, station.ini files are only used as the user editable settings source.
+import configparser
+import concurrent.futures
+from array import array
+import io
+import json
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+import mutagen
+import settings
+from timeline import StationTimeline
+
+LIBRARY_INDEX_VERSION = 2
+library_lock = threading.RLock()  # Held while scanned stations are swapped into the band list, never during a scan
+rescan_executor = None  # Probes files for the library watcher, created on its first rescan and kept for the next
+index_lock = threading.Lock()  # Writes of the library index, the newest band list is always written last
+
+# Ogg page header: capture pattern, version, header type, granule position, serial number, page sequence, CRC, segment count
+OGG_PAGE_HEADER = struct.Struct("<4sBBqIIIB")
+OGG_HEAD_READ_SIZE = 512  # Enough for the first page and the Vorbis or Opus identification header
+OGG_TAIL_READ_SIZE = 8192  # A typical last page is around 4 KB, the read grows if the page isn't found
+NUMBER_PATTERN = re.compile(r'(\d+)')
+
+
+#defualt structure:
+def get_default_station_data(path='', sub_folder_name='', band_name=''):
+    return {
+        "path": path,
+        "station_name": sub_folder_name,
+        "folder_name": band_name,
+        "station_files": [],
+        "station_ordered": False,
+        "station_lengths": [],
+        "total_length": 0,
+        "station_start": 0
+    }
+
+
+def extract_number(filename):
+    # Use regex to match numbers anywhere in the filename, including at the end or in parentheses
+    match = NUMBER_PATTERN.findall(os.path.basename(filename))
+    if match:
+        # Convert all matched numbers to integers and return them in order
+        return tuple(int(num) for num in match)
+    else:
+        # Return a large tuple to ensure unexpected formats are sorted last
+        return (float('inf'),)
+
+
+def natural_sort_key(file_name):
+    # Numbers in the name decide the order, the lowercase name breaks ties so the order doesn't depend on the file system
+    return extract_number(file_name), file_name.lower()
+
+
+def get_mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def relocate_station_paths(station_data, convert_path):
+    """
+    Return a copy of station_data with the station folder and file paths passed through convert_path.
+    """
+    station_data = dict(station_data)
+    station_data["path"] = convert_path(station_data["path"])
+    station_data["station_files"] = [convert_path(file_path) for file_path in station_data["station_files"]]
+    return station_data
+
+
+def pack_fingerprints(fingerprints):
+    """
+    Flatten [size, mtime_ns, inode] fingerprints into one array of 64 bit integers, a missing inode is stored as -1.
+    Fingerprints that don't fit, or lists with entries from older caches that have none, are returned unchanged.
+    """
+    try:
+        return array('q', [-1 if value is None else value for fingerprint in fingerprints for value in fingerprint])
+    except (TypeError, OverflowError):
+        return fingerprints
+
+
+def unpack_fingerprints(station_data):
+    """
+    Returns the fingerprints of station_data as a list of [size, mtime_ns, inode], None for files without one.
+    """
+    fingerprints = station_data.get("station_fingerprints")
+    if not fingerprints:
+        return [None] * len(station_data.get("station_lengths", []))
+    if isinstance(fingerprints, array):
+        return [[fingerprints[index], fingerprints[index + 1], fingerprints[index + 2] if fingerprints[index + 2] >= 0 else None]
+                for index in range(0, len(fingerprints), 3)]
+    return fingerprints
+
+
+def compact_station_data(station_data):
+    """
+    Store the lengths and fingerprints of station_data in arrays, a float in a list costs 32 bytes against 8 in an array.
+    The file paths are kept as they are, stations reference this list instead of copying it.
+    The timeline of the canonical order is built here once and shared by every station object made from station_data.
+    """
+    station_data["station_lengths"] = array('d', station_data.get("station_lengths", []))
+    if station_data.get("station_fingerprints"):
+        station_data["station_fingerprints"] = pack_fingerprints(station_data["station_fingerprints"])
+    station_data["timeline"] = StationTimeline(station_data["station_lengths"])
+    for seek_table in station_data.get("seek_tables", {}).values():
+        seek_table["entries"] = array('q', seek_table["entries"])
+    return station_data
+
+
+def export_station_data(station_data, radio_folder):
+    """
+    Returns a copy of station_data that can be written to the library index, with paths relative to radio_folder.
+    """
+    station_data = relocate_station_paths(station_data, lambda path: os.path.relpath(path, radio_folder))
+    station_data.pop("timeline", None)
+    station_data["station_lengths"] = list(station_data["station_lengths"])
+    if "station_fingerprints" in station_data:
+        station_data["station_fingerprints"] = unpack_fingerprints(station_data)
+    if "seek_tables" in station_data:
+        station_data["seek_tables"] = {name: dict(seek_table, entries=list(seek_table["entries"]))
+                                       for name, seek_table in station_data["seek_tables"].items()}
+    return station_data
+
+
+def load_library_index(index_file=settings.LIBRARY_INDEX_FILE, radio_folder=settings.STATIONS_ROOT_FOLDER):
+    """
+    Read the whole library index in one go. Returns an empty index if it is missing, unreadable or outdated.
+    Paths are stored relative to radio_folder so an index built on another computer can be used as is.
+    """
+    try:
+        with open(index_file, 'r') as file:
+            # Stations are compacted as they are parsed, so the whole index never exists as lists of floats
+            index = json.load(file, object_hook=lambda data: compact_station_data(data) if "station_lengths" in data else data)
+        if index.get("version") == 1:
+            return index  # Paths were stored as used at the time, no relocation needed
+        if index.get("version") != LIBRARY_INDEX_VERSION:
+            print(f"Warning: Library index version {index.get('version')} is outdated, ignoring it")
+            return {}
+        for band in index.get("bands", []):
+            band["stations"] = [relocate_station_paths(station_data, lambda path: os.path.join(radio_folder, path))
+                                for station_data in band["stations"]]
+        return index
+    except FileNotFoundError:
+        print(f"Info: No library index found at {index_file}")
+    except Exception as error:
+        print(f"ERROR: Could not read library index {index_file}: {error}")
+    return {}
+
+
+def save_library_index(radio_bands, index_file=settings.LIBRARY_INDEX_FILE, radio_folder=settings.STATIONS_ROOT_FOLDER):
+    """
+    Atomically replace the library index, a crash mid-write leaves the previous index in place.
+    """
+    with index_lock:
+        write_library_index(radio_bands, index_file, radio_folder)
+
+
+def write_library_index(radio_bands, index_file, radio_folder):
+    index = {
+        "version": LIBRARY_INDEX_VERSION,
+        "bands": [{
+            "folder_name": band["folder_name"],
+            "stations": [export_station_data(station_data, radio_folder) for station_data in band["stations"]],
+        } for band in radio_bands if band["stations"]],
+    }
+    index_folder = os.path.dirname(index_file) or "."
+    try:
+        file_descriptor, temp_file = tempfile.mkstemp(prefix=".library_", suffix=".tmp", dir=index_folder)
+        try:
+            with os.fdopen(file_descriptor, 'w') as file:
+                json.dump(index, file, separators=(",", ":"))
+                file.flush()
+                os.fsync(file.fileno())
+            os.chmod(temp_file, 0o644)
+            os.replace(temp_file, index_file)
+        except BaseException:
+            os.unlink(temp_file)
+            raise
+        print(f"Info: Library index saved to {index_file}")
+    except Exception as error:
+        print(f"ERROR: Failed to save library index {index_file}: {error}")
+
+
+def get_audio_length_mutagen(file_path):
+    try:
+        audio = mutagen.File(file_path)
+        if audio is not None and hasattr(audio.info, 'length'):
+            length = audio.info.length
+            #print(f"CACHE: {file_path}, Length: {length}")
+            return length
+        else:
+            raise ValueError(f"Mutagen could not read duration of {file_path}")
+    except Exception as e:
+        print(f"ERROR: While getting duration of {file_path} with mutagen: {e}")
+        return 0
+
+
+def parse_ogg_identification(head):
+    """
+    Returns (serial, sample rate, pre-skip, header packet count) from the first page of an Ogg Vorbis or Opus file,
+    or None if head doesn't start with one.
+    """
+    capture, version, header_type, granule, serial, sequence, crc, segments = OGG_PAGE_HEADER.unpack_from(head)
+    if capture != b"OggS" or version != 0 or not header_type & 0x02:
+        return None
+    packet = head[OGG_PAGE_HEADER.size + segments:]
+    if packet.startswith(b"\x01vorbis"):
+        sample_rate, pre_skip, header_packets = struct.unpack_from("<I", packet, 12)[0], 0, 3
+    elif packet.startswith(b"OpusHead"):
+        # Opus granule positions always count 48 kHz samples
+        sample_rate, pre_skip, header_packets = 48000, struct.unpack_from("<H", packet, 10)[0], 2
+    else:
+        return None
+    if not sample_rate:
+        return None
+    return serial, sample_rate, pre_skip, header_packets
+
+
+def get_audio_length_ogg(file_path):
+    """
+    Read the length of an Ogg Vorbis or Opus file from the identification header and the granule position of the last page.
+    Returns 0 if the file can't be handled this way so the caller can fall back to mutagen.
+    """
+    try:
+        with open(file_path, 'rb') as file:
+            identification = parse_ogg_identification(file.read(OGG_HEAD_READ_SIZE))
+            if not identification:
+                return 0
+            serial, sample_rate, pre_skip, header_packets = identification
+
+            # Search backwards from the end of the file for the last page of this stream
+            file_size = file.seek(0, os.SEEK_END)
+            read_size = OGG_TAIL_READ_SIZE
+            while True:
+                read_start = max(file_size - read_size, 0)
+                file.seek(read_start)
+                tail = file.read(file_size - read_start)
+                page_start = tail.rfind(b"OggS")
+                while page_start >= 0:
+                    if page_start + OGG_PAGE_HEADER.size <= len(tail):
+                        capture, version, header_type, granule, page_serial, sequence, crc, segments = OGG_PAGE_HEADER.unpack_from(tail, page_start)
+                        if version == 0 and page_serial == serial and granule >= 0:
+                            return max(granule - pre_skip, 0) / float(sample_rate)
+                    page_start = tail.rfind(b"OggS", 0, page_start)
+                if read_start == 0:
+                    return 0
+                read_size *= 8
+    except (OSError, struct.error):
+        return 0
+
+
+def build_seek_table(file_path, interval=settings.SEEK_TABLE_SETTINGS["interval"]):
+    """
+    Walk the Ogg pages of file_path and return its seek table, or None if it isn't a single Vorbis or Opus stream.
+    "entries" holds a (first sample, byte offset) pair for every interval seconds of audio: the last page starting
+    a new packet at or before that time. "audio_start" is where the header pages end.
+    """
+    try:
+        with open(file_path, 'rb') as file:
+            identification = parse_ogg_identification(file.read(OGG_HEAD_READ_SIZE))
+            if not identification:
+                return None
+            serial, sample_rate, pre_skip, header_packets = identification
+            interval_samples = interval * sample_rate
+            entries = array('q')
+            audio_start = None
+            header_packets_seen = 0
+            page_start_sample = 0
+            next_entry_sample = pre_skip  # Granule positions include the pre-skip
+            start_point = None
+            offset = 0
+            file.seek(0)
+            while True:
+                page_header = file.read(OGG_PAGE_HEADER.size)
+                if len(page_header) < OGG_PAGE_HEADER.size:
+                    break
+                capture, version, header_type, granule, page_serial, sequence, crc, segments = OGG_PAGE_HEADER.unpack(page_header)
+                if capture != b"OggS" or page_serial != serial:
+                    return None  # Damaged, chained or multiplexed files are left to the decoder's own seeking
+                lacing = file.read(segments)
+                page_size = OGG_PAGE_HEADER.size + segments + sum(lacing)
+                if audio_start is None:
+                    # Packets end on lacing values below 255, the first audio page follows the last header packet
+                    header_packets_seen += sum(1 for value in lacing if value < 255)
+                    if header_packets_seen >= header_packets:
+                        audio_start = offset + page_size
+                else:
+                    if not header_type & 0x01:
+                        # The page begins with a new packet, so decoding can start here
+                        while page_start_sample > next_entry_sample and start_point:
+                            entries.extend(start_point)
+                            next_entry_sample += interval_samples
+                        start_point = (page_start_sample, offset)
+                    if granule >= 0:
+                        page_start_sample = granule  # The next page starts where this one ends
+                offset += page_size
+                file.seek(offset)
+            if audio_start is None or not start_point:
+                return None
+            entries.extend(start_point)
+    except (OSError, struct.error) as error:
+        print(f"ERROR: Could not build a seek table for {file_path}: {error}")
+        return None
+    return {
+        "sample_rate": sample_rate,
+        "pre_skip": pre_skip,
+        "audio_start": audio_start,
+        "interval": interval,
+        "entries": entries,
+    }
+
+
+def find_seek_entry(seek_table, position):
+    """
+    Returns (start time, byte offset) of the page to start decoding from to play position seconds into the file.
+    The start time is at or before position, by less than the table interval.
+    """
+    entries = seek_table["entries"]
+    index = max(min(int(position // seek_table["interval"]), len(entries) // 2 - 1), 0)
+    start_sample, offset = entries[2 * index], entries[2 * index + 1]
+    return max(start_sample - seek_table["pre_skip"], 0) / float(seek_table["sample_rate"]), offset
+
+
+class OggPageStream(io.RawIOBase):
+    """
+    Read only view of an Ogg file: the header pages followed by the pages from offset to the end.
+    A decoder given this stream starts playing at offset without searching the file for it.
+    """
+
+    def __init__(self, file_path, audio_start, offset):
+        super(OggPageStream, self).__init__()
+        self.file = open(file_path, 'rb')
+        self.audio_start = audio_start
+        self.skipped = offset - audio_start
+        self.size = os.fstat(self.file.fileno()).st_size - self.skipped
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, position, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            position += self.position
+        elif whence == io.SEEK_END:
+            position += self.size
+        self.position = min(max(position, 0), self.size)
+        return self.position
+
+    def readinto(self, buffer):
+        if self.position < self.audio_start:
+            read_size = min(len(buffer), self.audio_start - self.position)
+            self.file.seek(self.position)
+        else:
+            read_size = min(len(buffer), self.size - self.position)
+            self.file.seek(self.position + self.skipped)
+        data = self.file.read(max(read_size, 0))
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def close(self):
+        self.file.close()
+        super(OggPageStream, self).close()
+
+
+def get_audio_length(file_path):
+    length = get_audio_length_ogg(file_path)
+    if length > 0:
+        return length
+    return get_audio_length_mutagen(file_path)
+
+
+def has_valid_ogg_files(path):
+    return any(file.name.endswith('.ogg') for file in os.scandir(path))
+
+def list_radio_bands(radio_folder, index_file=settings.LIBRARY_INDEX_FILE, use_index=True):
+    """
+    List the band folders without scanning them. Bands start with their cached stations and "loaded" set to False,
+    load_bands() validates and rescans them when they are first needed.
+    """
+    print("Startup: Starting folder search in:", radio_folder)
+    library_index = load_library_index(index_file, radio_folder) if use_index else {}
+    cached_bands = {band["folder_name"]: band.get("stations", []) for band in library_index.get("bands", [])}
+
+    radio_bands = []
+    for folder in sorted(os.scandir(radio_folder), key=lambda f: f.name.lower()):
+        if not folder.is_dir():
+            continue
+        # Folders missing from the index need at least one station folder with audio files to count as a band
+        if folder.name in cached_bands or any(sub_folder.is_dir() and has_valid_ogg_files(sub_folder.path)
+                                              for sub_folder in os.scandir(folder.path)):
+            radio_bands.append({
+                "folder_name": folder.name,
+                "stations": cached_bands.get(folder.name, []),
+                "loaded": False,
+            })
+
+    print(f"Debug: Listed radio bands - Total: {len(radio_bands)}")
+    return radio_bands
+
+
+def load_bands(radio_bands, band_numbers, radio_folder=settings.STATIONS_ROOT_FOLDER, index_file=settings.LIBRARY_INDEX_FILE,
+               executor=None, force_rescan=settings.RESET_CACHE, with_inode=True, build_seek_tables=False):
+    """
+    Validate the stations of the given bands and rescan any station folder that changed. Files are probed through executor,
+    a ThreadPoolExecutor sized by SCAN_SETTINGS is used if none is given. Bands that are already loaded are skipped.
+    The bands are scanned without holding library_lock, it is only taken to swap the results in, so a band change
+    never waits for the background warm-up to finish scanning another band.
+    """
+    bands = [radio_bands[band_number] for band_number in band_numbers if not radio_bands[band_number]["loaded"]]
+    if not bands:
+        return
+    if force_rescan:
+        print("WARNING: Cache rebuilding enabled. Every station folder will be rescanned")
+
+    new_bands = []
+    for band in bands:
+        cached_band = {station_data.get("path"): station_data for station_data in band["stations"]}
+        new_band = {"folder_name": band["folder_name"], "stations": []}
+        band_folder = os.path.join(radio_folder, band["folder_name"])
+        for sub_folder in sorted(os.scandir(band_folder), key=lambda f: f.name.lower()):
+            if not sub_folder.is_dir():
+                continue
+            station_data = handle_station_folder(sub_folder, band["folder_name"], cached_band.get(sub_folder.path), force_rescan, with_inode)
+            if station_data:
+                new_band["stations"].append(station_data)
+        new_bands.append(new_band)
+
+    # Probe the files of every rescanned station in one shared pool
+    if executor:
+        failed_files = scan_library(new_bands, executor, build_seek_tables)
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=settings.SCAN_SETTINGS["workers"]) as executor:
+            failed_files = scan_library(new_bands, executor, build_seek_tables)
+    if failed_files:
+        print(f"Warning: {len(failed_files)} files could not be decoded and were skipped")
+
+    changed = False
+    with library_lock:
+        for band, new_band in zip(bands, new_bands):
+            if band["loaded"]:
+                continue  # Loaded by another thread while this one was scanning
+            new_stations = [station_data for station_data in new_band["stations"] if validate_station_data(station_data)]
+            changed = changed or new_stations != band["stations"]
+            band["stations"] = new_stations
+            band["loaded"] = True
+            print("Debug: Found band folder:", band["folder_name"], "with", len(band["stations"]), "Stations")
+
+    if changed:
+        save_library_index(radio_bands, index_file, radio_folder)
+
+
+def get_radio_bands(radio_folder, index_file=settings.LIBRARY_INDEX_FILE, executor=None, force_rescan=settings.RESET_CACHE, use_index=True,
+                    with_inode=True, build_seek_tables=False):
+    """
+    Load every band at once, files of all rescanned stations are probed in one shared pool.
+    """
+    radio_bands = list_radio_bands(radio_folder, index_file, use_index)
+    load_bands(radio_bands, range(len(radio_bands)), radio_folder, index_file, executor, force_rescan, with_inode, build_seek_tables)
+    radio_bands = [band for band in radio_bands if band["stations"]]
+
+    if not radio_bands:
+        print("Warning: No valid radio bands found. Returning an empty list.")
+
+    print(f"Debug: Loaded radio bands - Total: {len(radio_bands)}")
+    return radio_bands
+
+
+def rescan_station_folders(radio_bands, station_folders, radio_folder=settings.STATIONS_ROOT_FOLDER, index_file=settings.LIBRARY_INDEX_FILE):
+    """
+    Rescan the given station folders of loaded bands, only new or changed files are probed.
+    Each changed band gets a new station list swapped in, returns the numbers of the changed bands.
+    A band folder that isn't in radio_bands yet is scanned whole and added at the end of the list, so the numbers
+    of the other bands don't change while the radio is running.
+    Files are probed without holding library_lock, so band changes and the warm-up carry on during a long copy.
+    """
+    global rescan_executor
+
+    station_folders = {os.path.normpath(station_folder) for station_folder in station_folders}
+    band_folder_names = {os.path.basename(os.path.dirname(folder)) for folder in station_folders
+                         if os.path.dirname(os.path.dirname(folder)) == os.path.normpath(radio_folder)}
+    known_folder_names = {band["folder_name"] for band in radio_bands}
+    new_bands = [{"folder_name": folder_name, "stations": [], "loaded": True} for folder_name in sorted(band_folder_names - known_folder_names)
+                 if os.path.isdir(os.path.join(radio_folder, folder_name))]
+
+    rescans = []
+    for band_number, band in list(enumerate(radio_bands)) + [(None, band) for band in new_bands]:
+        if band["folder_name"] not in band_folder_names or not band["loaded"]:
+            continue  # Bands that aren't loaded yet are validated when they are
+
+        # Unchanged stations keep their data, changed or new folders are rescanned, every folder of a new band is
+        band_folder = os.path.join(radio_folder, band["folder_name"])
+        old_stations = band["stations"]
+        cached_band = {os.path.normpath(station_data["path"]): station_data for station_data in old_stations}
+        new_band = {"folder_name": band["folder_name"], "stations": []}
+        for sub_folder in sorted(os.scandir(band_folder), key=lambda f: f.name.lower()):
+            if not sub_folder.is_dir():
+                continue
+            folder = os.path.normpath(sub_folder.path)
+            cached_data = cached_band.get(folder)
+            if folder in station_folders or band_number is None:
+                station_data = handle_station_folder(sub_folder, band["folder_name"], cached_data, force_rescan=True)
+                if station_data:
+                    new_band["stations"].append(station_data)
+            elif cached_data:
+                new_band["stations"].append(cached_data)
+        rescans.append((band_number, old_stations, new_band))
+    if not rescans:
+        return []
+
+    # Every changed band is probed in one pass through the executor the watcher keeps between rescans
+    if rescan_executor is None:
+        rescan_executor = concurrent.futures.ThreadPoolExecutor(max_workers=settings.SCAN_SETTINGS["workers"])
+    scan_library([new_band for band_number, old_stations, new_band in rescans], rescan_executor)
+
+    changed_bands = []
+    with library_lock:
+        for band_number, old_stations, new_band in rescans:
+            new_stations = [station_data for station_data in new_band["stations"] if validate_station_data(station_data)]
+            if band_number is None:
+                if not new_stations or any(band["folder_name"] == new_band["folder_name"] for band in radio_bands):
+                    continue  # No audio files yet, or added by an earlier rescan
+                radio_bands.append({"folder_name": new_band["folder_name"], "stations": new_stations, "loaded": True})
+                changed_bands.append(len(radio_bands) - 1)
+                print(f"Info: Band {new_band['folder_name']} added, {len(new_stations)} stations")
+                continue
+            band = radio_bands[band_number]
+            if band["stations"] is not old_stations or new_stations == old_stations:
+                continue  # Unchanged, or replaced while this rescan was probing
+            band["stations"] = new_stations
+            changed_bands.append(band_number)
+            print(f"Info: Band {band['folder_name']} updated, {len(new_stations)} stations")
+
+    if changed_bands:
+        save_library_index(radio_bands, index_file, radio_folder)
+    return changed_bands
+
+
+def start_warmup(radio_bands, delay=settings.SCAN_SETTINGS["warmup_delay"]):
+    """
+    Load the remaining bands one at a time in a low priority background thread.
+    """
+    def warm_up():
+        try:
+            # Linux applies the nice value to this thread only, scan threads started from it inherit it
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError) as error:
+            print(f"Warning: Could not lower the library warm-up priority: {error}")
+        time.sleep(delay)
+        start_time = time.time()
+        for band_number in range(len(radio_bands)):
+            try:
+                load_bands(radio_bands, [band_number])
+            except Exception as error:
+                print(f"ERROR: Library warm-up failed for band {radio_bands[band_number]['folder_name']}: {error}")
+        print(f"Info: Library warm-up done in {round(time.time() - start_time, 1)} s")
+
+    warmup_thread = threading.Thread(target=warm_up, name="library_warmup", daemon=True)
+    warmup_thread.start()
+    return warmup_thread
+
+
+
+def handle_station_folder(sub_folder, band_name, cached_data=None, force_rescan=False, with_inode=True):
+    """
+    Returns the cached station data if the folder is unchanged, otherwise a station scan to be completed by scan_library().
+    Returns None for a new folder without any audio files.
+    """
+    path = sub_folder.path
+    station_ini_file = os.path.join(path, "station.ini")
+
+    # Every file is compared, a file overwritten in place doesn't change the folder mtime
+    manifest = scan_station_folder(path, with_inode)
+    if not force_rescan and cached_data and station_files_match(cached_data, manifest):
+        station_data = dict(cached_data)
+        if station_data.get("ini_mtime_ns") != get_mtime_ns(station_ini_file):
+            print(f"DEBUG: Settings changed in {sub_folder.name}.")
+            read_station_settings(station_ini_file, station_data)
+            station_data["ini_mtime_ns"] = get_mtime_ns(station_ini_file)
+        return station_data
+
+    if not manifest["station_files"] and not cached_data:
+        return None
+
+    if not cached_data and manifest["has_station_ini"]:
+        # Seed from a [cache] section left by older versions, which avoids probing every file again
+        try:
+            station_ini_parser = configparser.ConfigParser()
+            station_ini_parser.read(station_ini_file)
+            if station_ini_parser.has_section("cache"):
+                cached_data = json.loads(station_ini_parser.get("cache", "station_data"))
+        except Exception as error:
+            print(f"ERROR: Exception reading cache for {sub_folder.name}: {error}")
+
+    print(f"DEBUG: Rescanning {sub_folder.name}.")
+    return prepare_station_scan(path, sub_folder.name, band_name, cached_data, manifest)
+
+
+def scan_station_folder(path, with_inode=True):
+    """
+    List a station folder with a single os.scandir. Returns a manifest of its .ogg files in natural order,
+    with fingerprints taken from the DirEntry stat results.
+    """
+    station_files = []
+    has_station_ini = False
+    for entry in os.scandir(path):
+        name = entry.name
+        if name.endswith(".ogg") and not name.startswith("."):
+            try:
+                stat_result = entry.stat()
+            except OSError:
+                continue
+            station_files.append((natural_sort_key(name), name, entry.path, get_file_fingerprint(stat_result, with_inode)))
+        elif name == "station.ini":
+            has_station_ini = True
+    station_files.sort(key=lambda station_file: station_file[0])
+    return {
+        "station_names": [station_file[1] for station_file in station_files],
+        "station_files": [station_file[2] for station_file in station_files],
+        "station_fingerprints": [station_file[3] for station_file in station_files],
+        "has_station_ini": has_station_ini,
+    }
+
+
+
+def read_station_settings(station_ini_file, station_data):
+    """
+    Apply the user editable [settings] section of a station.ini file to station_data, returns the parser.
+    """
+    station_ini_parser = configparser.ConfigParser()
+    if os.path.exists(station_ini_file):
+        try:
+            station_ini_parser.read(station_ini_file)
+            if station_ini_parser.has_section("settings"):
+                station_data["station_ordered"] = station_ini_parser.getboolean("settings", "station_ordered", fallback=station_data["station_ordered"])
+                station_data["station_start"] = station_ini_parser.getint("settings", "station_start", fallback=station_data["station_start"])
+        except Exception as e:
+            print(f"Error reading settings from {station_ini_file}: {str(e)}")
+    return station_ini_parser
+
+
+def validate_station_data(data):
+    return data.get("station_files") and isinstance(data["station_files"], list) and data["station_files"]
+
+def get_file_fingerprint(stat_result, with_inode=True):
+    """
+    Identify a version of a file by its size, modification time and inode.
+    Inode numbers aren't stable between computers on some file systems, indexes built elsewhere leave them out.
+    """
+    return [stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino if with_inode else None]
+
+
+def fingerprint_matches(cached_fingerprint, fingerprint):
+    # Cached entries from older versions have no fingerprints, their files are probed again
+    if cached_fingerprint is None or fingerprint is None or cached_fingerprint[:2] != fingerprint[:2]:
+        return False
+    return cached_fingerprint[2] is None or cached_fingerprint[2] == fingerprint[2]
+
+
+def station_files_match(cached_data, manifest):
+    """
+    True if a station folder manifest lists the same files as cached_data, each with a matching fingerprint.
+    """
+    if [os.path.basename(file_path) for file_path in cached_data.get("station_files", [])] != manifest["station_names"]:
+        return False
+    cached_fingerprints = unpack_fingerprints(cached_data)
+    if len(cached_fingerprints) != len(manifest["station_fingerprints"]):
+        return False
+    return all(fingerprint_matches(cached_fingerprint, fingerprint)
+               for cached_fingerprint, fingerprint in zip(cached_fingerprints, manifest["station_fingerprints"]))
+
+
+def prepare_station_scan(path, sub_folder_name, band_name, cached_data=None, manifest=None):
+    """
+    Match a station folder manifest against cached_data. Files whose fingerprint matches keep their cached length
+    and seek table, the rest are listed in "probe_indexes" for scan_library() to probe.
+    """
+    if manifest is None:
+        manifest = scan_station_folder(path)
+    station_files = manifest["station_files"]
+    station_fingerprints = manifest["station_fingerprints"]
+
+    cached_files = {}
+    if cached_data:
+        cached_lengths = cached_data.get("station_lengths", [])
+        cached_fingerprints = unpack_fingerprints(cached_data)
+        cached_seek_tables = cached_data.get("seek_tables", {})
+        for file_path, length, fingerprint in zip(cached_data.get("station_files", []), cached_lengths, cached_fingerprints):
+            file_name = os.path.basename(file_path)
+            cached_files[file_name.strip().lower()] = (fingerprint, length, cached_seek_tables.get(file_name))
+
+    # Only new or changed files need their length probed
+    station_lengths = [0] * len(station_files)
+    seek_tables = {}
+    probe_indexes = []
+    for index, name in enumerate(manifest["station_names"]):
+        fingerprint, length, seek_table = cached_files.get(name.strip().lower(), (None, 0, None))
+        if length > 0 and fingerprint_matches(fingerprint, station_fingerprints[index]):
+            station_lengths[index] = length
+            if seek_table:
+                seek_tables[name] = seek_table
+        else:
+            probe_indexes.append(index)
+
+    station_data = get_default_station_data(path, sub_folder_name, band_name)
+    station_data.update({
+        "station_files": station_files,
+        "station_lengths": station_lengths,
+        "station_fingerprints": station_fingerprints,
+        "probe_indexes": probe_indexes,
+    })
+    if seek_tables:
+        station_data["seek_tables"] = seek_tables
+    return station_data
+
+
+def scan_library(radio_bands, executor, build_seek_tables=False):
+    """
+    Probe the files of every prepared station scan in radio_bands through one executor, then finish each station in place.
+    Lengths are written back by file index, so they always line up with station_files.
+    With build_seek_tables, files of at least SEEK_TABLE_SETTINGS["min_length"] without a seek table get one.
+    Returns the files that could not be decoded, they are also reported as they are found.
+    """
+    start_time = time.time()
+    future_to_file = {}
+    band_probes_left = {}
+    for band in radio_bands:
+        band_name = band["folder_name"]
+        band_probes_left[band_name] = 0
+        for station_data in band["stations"]:
+            for index in station_data.get("probe_indexes", []):
+                future = executor.submit(get_audio_length, station_data["station_files"][index])
+                future_to_file[future] = (band_name, station_data, index)
+                band_probes_left[band_name] += 1
+        if band_probes_left[band_name]:
+            print(f"Scan: Queued {band_probes_left[band_name]} files from band {band_name}")
+
+    total_probes = len(future_to_file)
+    failed_files = []
+    for probes_done, future in enumerate(concurrent.futures.as_completed(future_to_file), 1):
+        band_name, station_data, index = future_to_file.pop(future)
+        file_path = station_data["station_files"][index]
+        try:
+            station_data["station_lengths"][index] = future.result()
+        except Exception as e:
+            print(f"Failed to get length for {file_path}: {str(e)}")
+        if station_data["station_lengths"][index] <= 0:
+            print(f"Warning: Invalid length for {file_path}, it will be skipped.")
+            failed_files.append(file_path)
+        band_probes_left[band_name] -= 1
+        if not band_probes_left[band_name]:
+            print(f"Scan: Band {band_name} done, {probes_done} of {total_probes} files probed in {round(time.time() - start_time, 1)} s")
+
+    if build_seek_tables:
+        build_station_seek_tables(radio_bands, executor)
+
+    for band in radio_bands:
+        band["stations"] = [finish_station_scan(station_data) if "probe_indexes" in station_data else station_data
+                            for station_data in band["stations"]]
+    return failed_files
+
+
+def build_station_seek_tables(radio_bands, executor):
+    """
+    Build the missing seek tables of long files in the prepared station scans of radio_bands, in parallel.
+    Reading every page header means reading the whole file, so this is meant for the desktop indexer.
+    """
+    start_time = time.time()
+    future_to_file = {}
+    for band in radio_bands:
+        for station_data in band["stations"]:
+            if "probe_indexes" not in station_data:
+                continue
+            seek_tables = station_data.get("seek_tables", {})
+            for file_path, length in zip(station_data["station_files"], station_data["station_lengths"]):
+                if length >= settings.SEEK_TABLE_SETTINGS["min_length"] and os.path.basename(file_path) not in seek_tables:
+                    future_to_file[executor.submit(build_seek_table, file_path)] = (station_data, os.path.basename(file_path))
+    if not future_to_file:
+        return
+
+    print(f"Scan: Building seek tables for {len(future_to_file)} long files")
+    for future in concurrent.futures.as_completed(future_to_file):
+        station_data, file_name = future_to_file[future]
+        try:
+            seek_table = future.result()
+        except Exception as error:
+            print(f"ERROR: Seek table for {file_name} failed: {error}")
+            continue
+        if seek_table:
+            station_data.setdefault("seek_tables", {})[file_name] = seek_table
+    print(f"Scan: Seek tables built in {round(time.time() - start_time, 1)} s")
+
+
+def finish_station_scan(station_data):
+    """
+    Turn a probed station scan into station data, dropping unreadable files and saving the station settings.
+    """
+    path = station_data["path"]
+    sub_folder_name = station_data["station_name"]
+    station_ini_file = os.path.join(path, "station.ini")
+    probe_count = len(station_data.pop("probe_indexes"))
+    print(f"Info: {sub_folder_name}: Reused {len(station_data['station_files']) - probe_count} cached lengths, probed {probe_count} files")
+
+    # Drop unreadable files so the file, length and fingerprint lists stay aligned
+    station_files = []
+    station_lengths = []
+    station_fingerprints = []
+    for file_path, length, fingerprint in zip(station_data["station_files"], station_data["station_lengths"], station_data["station_fingerprints"]):
+        if length > 0:
+            station_files.append(file_path)
+            station_lengths.append(length)
+            station_fingerprints.append(fingerprint)
+
+    if not station_lengths:
+        print(f"Warning: Could not determine lengths for any files in {sub_folder_name}. Skipping station.")
+        return get_default_station_data(path, sub_folder_name, station_data["folder_name"])
+
+    # Read existing settings if available
+    station_ini_parser = read_station_settings(station_ini_file, station_data)
+
+    # Seek tables of dropped files go with them
+    if "seek_tables" in station_data:
+        file_names = {os.path.basename(file_path) for file_path in station_files}
+        station_data["seek_tables"] = {file_name: seek_table for file_name, seek_table in station_data["seek_tables"].items()
+                                       if file_name in file_names}
+
+    # Update station_data with new values
+    station_data.update({
+        "station_files": station_files,
+        "station_lengths": station_lengths,
+        "station_fingerprints": station_fingerprints,
+        "total_length": sum(station_lengths),
+    })
+
+    # The song metadata now lives in the library index, station.ini only keeps the user settings
+    if not station_ini_parser.has_section("settings") or station_ini_parser.has_section("cache"):
+        station_ini_parser.remove_section("cache")
+        station_ini_parser["settings"] = {
+            "station_ordered": str(station_data["station_ordered"]),
+            "station_start": str(station_data["station_start"]),
+        }
+        try:
+            with open(station_ini_file, 'w') as configfile:
+                station_ini_parser.write(configfile)
+            print(f"Info: Settings for {sub_folder_name} saved successfully.")
+        except Exception as e:
+            print(f"Error: Failed to save settings for {sub_folder_name}: {str(e)}")
+
+    # Stamp the settings file so the next boot only rereads it when it changed
+    station_data["ini_mtime_ns"] = get_mtime_ns(station_ini_file)
+    return compact_station_data(station_data)
+
+
+def rebuild_station_cache(path, sub_folder_name, band_name, cached_data=None):
+    """
+    Scan a single station folder. Files whose fingerprint matches cached_data keep their cached length, the rest are probed.
+    """
+    print(f"INFO: Starting Data Cache Rebuild for {sub_folder_name}")
+    radio_bands = [{"folder_name": band_name, "stations": [prepare_station_scan(path, sub_folder_name, band_name, cached_data)]}]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=settings.SCAN_SETTINGS["workers"]) as executor:
+        scan_library(radio_bands, executor)
+    return radio_bands[0]["stations"][0]
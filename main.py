@@ -1,29 +1,37 @@
 # Licence: Attribution-NonCommercial-ShareAlike 4.0 International (CC BY-NC-SA 4.0) Written by ZapWizard (Joshua Driggs)
 
 #!/usr/bin/python3
+import asyncio
 import atexit
+import concurrent.futures
 import configparser
-import glob
 import os
 import random
 import sys
+import threading
 import time
-from collections import deque
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import datetime
+import math
+from array import array
 import schedule
 import ast
-import json
 import subprocess
-import concurrent.futures
 import signal
-import mutagen
 import serial
 from copy import deepcopy
 from subprocess import call
-import re
 import setup
 setup.initialize()
+import dial
+import library
+import watcher
+from dial import map_range
+from prefetch import Prefetcher
+from sound_cache import SoundCache
+from uart_reader import UartReader
+from pi_pico_files.uart_protocol import UartProtocol
+from timeline import StationTimeline, get_shuffled_order
 import pygame
 import settings
 
@@ -53,6 +61,7 @@ volume_prev = float(0.0)
 station_num = int(0)
 station_list = []
 stations = []
+station_pool = OrderedDict()  # Band number to (station data list, stations) of recently used bands, least recent first
 total_station_num = int(0)
 radio_band = int(0)
 radio_band_list = []
@@ -66,6 +75,7 @@ tuning_volume = 0
 tuning_seperation = 5
 tuning_locked = False
 tuning_prev_angle = None
+tuning_table = None  # Nearest station, distance and zone for each angle step of the current band, see dial.py
 ADC_0_Prev_Values = []
 ADC_2_Prev_Values = []
 ADC_2_Prev_Value = 0
@@ -74,11 +84,26 @@ heartbeat_time = 0
 pico_state = False
 pico_heartbeat_time = 0
 uart = None
+uart_reader = None  # Reads and frames the Pi Pico's messages in the background, started in run()
+uart_protocol = UartProtocol(settings.UART_SETTINGS["binary_protocol"])  # CSV lines until the Pi Pico offers binary frames, it uses the same code
+superseded_messages = {"M": 0, "V": 0}  # Motor and volume messages dropped because a newer one arrived in the same batch
+tuning_latency = {"count": 0, "total": 0, "max": 0}  # M message to tuning, collected when UART_SETTINGS["measure_latency"] is set
 exit_requested = False  # Add a flag to indicate whether the script should exit
+background_reconnect = False  # Set by the asyncio runtime, send_uart then leaves reconnecting to its task
+radio_executor = None  # The radio thread of the asyncio runtime
+uart_send_lock = threading.Lock()  # The asyncio runtime sends heartbeats from the event loop and messages from the radio thread
 static_playback_active = False
 large_static_files = None
 static_sounds = None
 static_via_music = False
+prefetcher = None  # Warms the next song into the page cache, started in run()
+needle_speed = 0  # Smoothed needle speed in degrees per second, positive towards the end of the dial
+needle_prev = None  # (angle, time) of the previous motor message
+prewarm_targets = ()  # Stations ahead of the needle that were last prewarmed
+callout_active = False  # A band callout is playing, station changes wait for it to end
+callout_deadline = 0  # When the callout is treated as ended if its end event never arrives
+pending_station = None  # (station number, manual) selected while the band callout plays
+song_gaps = {"count": 0, "total": 0, "max": 0, "end_time": None}  # Silence between songs, collected when PLAYBACK_SETTINGS["measure_gaps"] is set
 
 # Time related
 midnight_str = time.strftime( "%m/%d/%Y" ) + " 00:00:00"
@@ -99,32 +124,6 @@ try:
 except Exception as e:
     sys.exit("Error: Sound setup failed" + str(e))
 
-#defualt structure:
-def get_default_station_data(path='', sub_folder_name='', band_name=''):
-    return {
-        "path": path,
-        "station_name": sub_folder_name,
-        "folder_name": band_name,
-        "station_files": [],
-        "station_ordered": False,
-        "station_lengths": [],
-        "total_length": 0,
-        "station_start": 0
-    }
-
-
-def extract_number(filename):
-    # Use regex to match numbers anywhere in the filename, including at the end or in parentheses
-    match = re.findall(r'(\d+)', os.path.basename(filename))
-    if match:
-        # Convert all matched numbers to integers and return them in order
-        return tuple(int(num) for num in match)
-    else:
-        # Return a large tuple to ensure unexpected formats are sorted last
-        return (float('inf'),)
-
-
-
 print("Startup: Starting pygame initialization")
 os.environ["SDL_VIDEODRIVER"] = "dummy"  # Make a fake screen
 os.environ['SDL_AUDIODRIVER'] = 'alsa'
@@ -140,11 +139,10 @@ pygame.mixer.Channel(1)
 pygame.mixer.Channel(2)
 pygame.mixer.Channel(3)
 pygame.mixer.Channel(4)
+pygame.mixer.Channel(1).set_endevent(settings.EVENTS['STATIC_END'])  # Wakes the main loop to start the next static sound
 
-snd_off = pygame.mixer.Sound(settings.SOUND_EFFECTS["off"])
-snd_on = pygame.mixer.Sound(settings.SOUND_EFFECTS["on"])
-snd_band = pygame.mixer.Sound(settings.SOUND_EFFECTS["band_change"])
-snd_error = pygame.mixer.Sound(settings.SOUND_EFFECTS["error"])
+# UI effects and band callouts are decoded on first use, or callouts in the background after startup
+sound_cache = SoundCache(settings.SOUND_CACHE_SETTINGS["budget"])
 
 
 
@@ -190,15 +188,6 @@ def load_saved_settings():
 
 
 
-def map_range(x, in_min, in_max, out_min, out_max):
-    if in_max <= 0 or in_max == in_min:
-        in_max = in_min + 0.001
-    if out_min <= out_max:
-        return max(min((x-in_min) * (out_max - out_min) / (in_max-in_min) + out_min, out_max), out_min)
-    else:
-        return min(max((x-in_min) * (out_max - out_min) / (in_max-in_min) + out_min, out_max), out_min)
-
-
 def blink_led():
     global led_state
     if not settings.DISABLE_HEARTBEAT_LED:
@@ -265,7 +254,7 @@ def clamp(number, minimum, maximum):
 
 
 def standby(force=False):
-    global on_off_state, motor_angle, motor_angle_prev, volume, snd_off
+    global on_off_state, motor_angle, motor_angle_prev, volume
     if on_off_state or force:
         on_off_state = False
         print("Info: Going into standby")
@@ -273,20 +262,26 @@ def standby(force=False):
         if active_station:
             active_station.stop()
         pygame.mixer.Channel(2).set_volume(settings.VOLUME_SETTINGS["effects"])
-        pygame.mixer.Channel(2).play(snd_off)
+        pygame.mixer.Channel(2).play(sound_cache.get(settings.SOUND_EFFECTS["off"]))
         save_settings()
         play_static(False)
+        print(f"Info: Superseded UART messages dropped, motor: {superseded_messages['M']}, volume: {superseded_messages['V']}")
+        print(f"Info: UART frames: {uart_protocol.frames}, CSV lines: {uart_protocol.csv_lines}, "
+              f"CRC errors: {uart_protocol.crc_errors}, lost frames: {uart_protocol.lost_frames}")
+        if callout_active:
+            pygame.mixer.Channel(3).stop()
+            finish_band_callout()  # Drops the station change that was waiting for it
 
 
 def resume_from_standby(force=False):
-    global on_off_state, motor_angle,  motor_angle_prev, volume_prev, snd_on, station_num
+    global on_off_state, motor_angle,  motor_angle_prev, volume_prev, station_num
     if not on_off_state or force:
         print("Info: Resume from standby")
         pygame.time.set_timer(settings.EVENTS['BLINK'], 1000)
         on_off_state = True
 
         pygame.mixer.Channel(2).set_volume(settings.VOLUME_SETTINGS["effects"])
-        pygame.mixer.Channel(2).play(snd_on)
+        pygame.mixer.Channel(2).play(sound_cache.get(settings.SOUND_EFFECTS["on"]))
 
         volume_settings, station_number, radio_band_number = load_saved_settings()
         set_volume_level(volume_settings)
@@ -317,7 +312,7 @@ def handle_event(event):
         # Only handle SONG_END if it's associated with active music playback
         if active_station and active_station.state == active_station.STATES['playing']:
             print("Info: Song ended, Playing next song")
-            active_station.next_song()
+            active_station.song_ended()
         #else:
             #print("DEBUG: Ignoring SONG_END triggered by non-music playback")
     elif event.type == settings.EVENTS['PLAYPAUSE']:
@@ -325,259 +320,84 @@ def handle_event(event):
         active_station.pause_play()
     elif event.type == settings.EVENTS['BLINK']:
         blink_led()
+    elif event.type == settings.EVENTS['LIBRARY_CHANGED']:
+        apply_library_changes(event.bands)
+    elif event.type in (settings.EVENTS['UART_MESSAGE'], settings.EVENTS['STATIC_END']):
+        pass  # Only wake the main loop, UART messages and static are handled there
+    elif event.type == settings.EVENTS['CALLOUT_END']:
+        # A callout replaced by the next band's callout also ends, only finish once the channel is free
+        if callout_active and not pygame.mixer.Channel(3).get_busy():
+            finish_band_callout()
     else:
         print("Event:", event)
 
 
 
 
-def get_audio_length_mutagen(file_path):
-    try:
-        audio = mutagen.File(file_path)
-        if audio is not None and hasattr(audio.info, 'length'):
-            length = audio.info.length
-            #print(f"CACHE: {file_path}, Length: {length}")
-            return length
-        else:
-            raise ValueError(f"Mutagen could not read duration of {file_path}")
-    except Exception as e:
-        print(f"ERROR: While getting duration of {file_path} with mutagen: {e}")
-        return 0
-
-
-def has_valid_ogg_files(path):
-    return any(file.name.endswith('.ogg') for file in os.scandir(path))
-
-def get_radio_bands(radio_folder):
-    global master_start_time
-    print("Startup: Starting folder search in:", radio_folder)
-
-    if settings.RESET_CACHE:
-        print("WARNING: Cache rebuilding enabled. This can take a while!")
-
-    radio_bands = []
-
-    for folder in sorted(os.scandir(radio_folder), key=lambda f: f.name.lower()):
-        if folder.is_dir():
-            sub_radio_bands = []
-
-            for sub_folder in sorted(os.scandir(folder.path), key=lambda f: f.name.lower()):
-                if sub_folder.is_dir() and has_valid_ogg_files(sub_folder.path):
-                    # Set force_rebuild to True if needed
-                    station_data = handle_station_folder(sub_folder, folder.name, force_rebuild=settings.RESET_CACHE)
-                    if station_data:
-                        sub_radio_bands.append(station_data)
-                        
-
-            if sub_radio_bands:
-                radio_bands.append({
-                    "folder_name": folder.name,
-                    "stations": sub_radio_bands
-                })
-            print("Debug: Found band folder:", folder.name, "with", len(sub_radio_bands), "Stations" )
-    
-    if not radio_bands:
-        print("Warning: No valid radio bands found. Returning an empty list.")
-    
-    print(f"Debug: Loaded radio bands - Total: {len(radio_bands)}")
-    return radio_bands
-
-              
-                
-def handle_station_folder(sub_folder, band_name, force_rebuild=False):
-    path = sub_folder.path
-    station_ini_file = os.path.join(path, "station.ini")
-    rebuild_needed = settings.RESET_CACHE or force_rebuild or not os.path.exists(station_ini_file)
-    station_data = {}
-
-    # Normalize and sort the current .ogg files
-    current_files = sorted(os.path.basename(f).strip().lower() for f in glob.glob(os.path.join(path, "*.ogg")))
-
-    if not rebuild_needed:
-        try:
-            station_ini_parser = configparser.ConfigParser()
-            station_ini_parser.read(station_ini_file)
-
-            if station_ini_parser.has_section("cache"):
-                station_data_str = station_ini_parser.get("cache", "station_data")
-                station_data = json.loads(station_data_str)
-
-                # Normalize and sort the cached file list
-                cached_files = sorted(os.path.basename(f).strip().lower() for f in station_data.get("station_files", []))
-
-                # Compare paths
-                cached_path = station_data.get("path")
-                if cached_path != path:
-                    print(f"DEBUG: Path mismatch in {sub_folder.name}. Cached: {cached_path}, Current: {path}")
-                    rebuild_needed = True
-
-                # Compare file lists
-                if current_files != cached_files:
-                    print(f"DEBUG: File mismatch in {sub_folder.name}.")
-                    #print(f"DEBUG: Current files ({len(current_files)}): {current_files}")
-                    #print(f"DEBUG: Cached files ({len(cached_files)}): {cached_files}")
-                    rebuild_needed = True
-
-        except Exception as error:
-            print(f"ERROR: Exception reading cache for {sub_folder.name}: {error}")
-            rebuild_needed = True
-
-    if rebuild_needed:
-        print(f"DEBUG: Rebuilding cache for {sub_folder.name}.")
-        #print(f"DEBUG: Rebuilding cache for {sub_folder.name}. Current files: {current_files}")
-        station_data = rebuild_station_cache(path, sub_folder.name, band_name)
-
-    return station_data
-
-
-
-
-
-
-
-
-def validate_station_data(data):
-    return data.get("station_files") and isinstance(data["station_files"], list) and data["station_files"]
-    
-def rebuild_station_cache(path, sub_folder_name, band_name):
-    print(f"INFO: Starting Data Cache Rebuild for {sub_folder_name}")
-    station_ini_file = os.path.join(path, "station.ini")
-    station_files = glob.glob(os.path.join(path, "*.ogg"))
-
-    if not station_files:
-        print(f"Warning: No audio files found in {sub_folder_name}. Skipping station.")
-        return get_default_station_data(path, sub_folder_name, band_name)
-
-    # Sort files using the updated extract_number function
-    station_files = sorted(station_files, key=extract_number)
-
-    # Get audio lengths in parallel
-    station_lengths = []
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        future_to_file = {executor.submit(get_audio_length_mutagen, file_path): file_path for file_path in station_files}
-        for future in concurrent.futures.as_completed(future_to_file):
-            file_path = future_to_file[future]
-            try:
-                length = future.result()
-                if length > 0:
-                    station_lengths.append(length)
-                else:
-                    print(f"Warning: Invalid length for {file_path}.")
-            except Exception as e:
-                print(f"Failed to get length for {file_path}: {str(e)}")
-
-    if not station_lengths:
-        print(f"Warning: Could not determine lengths for any files in {sub_folder_name}. Skipping station.")
-        return get_default_station_data(path, sub_folder_name, band_name)
-
-    total_length = sum(station_lengths)
-
-    # Read existing settings if available
-    station_ini_parser = configparser.ConfigParser()
-    station_data = get_default_station_data(path, sub_folder_name, band_name)
-
-    if os.path.exists(station_ini_file):
-        try:
-            station_ini_parser.read(station_ini_file)
-            if station_ini_parser.has_section("settings"):
-                # Preserve existing settings
-                station_ordered = station_ini_parser.getboolean("settings", "station_ordered", fallback=station_data["station_ordered"])
-                station_start = station_ini_parser.getint("settings", "station_start", fallback=station_data["station_start"])
-
-                # Update station_data with settings from the file
-                station_data["station_ordered"] = station_ordered
-                station_data["station_start"] = station_start
-        except Exception as e:
-            print(f"Error reading settings from station.ini for {sub_folder_name}: {str(e)}")
-
-    # Ensure files are sorted by number if station is ordered
-    if station_data["station_ordered"]:
-        station_files = sorted(station_files, key=extract_number)
-
-    # Update station_data with new values
-    station_data.update({
-        "station_files": station_files,
-        "station_lengths": station_lengths,
-        "total_length": total_length,
-    })
-
-    # Save updated station data and settings back to the ini file
-    station_ini_parser["settings"] = {
-        "station_ordered": str(station_data["station_ordered"]),
-        "station_start": str(station_data["station_start"]),
-    }
-    station_ini_parser["cache"] = {
-        "station_data": json.dumps(station_data, indent=4)
-    }
-
-    try:
-        with open(station_ini_file, 'w') as configfile:
-            station_ini_parser.write(configfile)
-        print(f"Info: Cache for {sub_folder_name} rebuilt and saved successfully.")
-    except Exception as e:
-        print(f"Error: Failed to save cache for {sub_folder_name}: {str(e)}")
+def rescan_library(station_folders):
+    """
+    Called from the library watcher thread, rescans the changed folders and tells the main loop which bands changed.
+    """
+    changed_bands = library.rescan_station_folders(radio_band_list, station_folders)
+    if changed_bands:
+        pygame.event.post(pygame.event.Event(settings.EVENTS['LIBRARY_CHANGED'], bands=changed_bands))
 
-    return station_data
 
+def apply_library_changes(changed_bands):
+    """
+    Swap rescanned station data into the live stations of the current band without interrupting the current song.
+    Stations added to or removed from the current band change the dial straight away, new bands are added at the end.
+    """
+    global radio_band_total, stations, station_num, active_station, total_station_num
+    global tuning_seperation, tuning_table, tuning_prev_angle, tuning_locked, pending_station
 
+    if len(radio_band_list) != radio_band_total:
+        print(f"Info: {len(radio_band_list) - radio_band_total} new bands found, now {len(radio_band_list)} bands")
+        radio_band_total = len(radio_band_list)
+    if radio_band not in changed_bands:
+        return
+    if not radio_band_list[radio_band]["stations"]:
+        # Every station of the current band was removed, move on to the next band that has stations
+        print(f"Info: Band {radio_band_list[radio_band]['folder_name']} has no stations left")
+        select_band(radio_band)
+        tuning_prev_angle = None
+        tuning_locked = False
+        return
 
+    station_data_list = radio_band_list[radio_band]["stations"]
+    old_paths = [station.path for station in stations]
+    station_pool[radio_band] = (None, stations)  # Stations that are still there get their new data
+    stations = get_band_stations(radio_band, station_data_list)
+    if [station.path for station in stations] != old_paths:
+        # The dial changed, a removed station stops and the next tuning pass finds the station under the needle
+        print(f"Info: Band now has {len(station_data_list)} stations, updating the dial")
+        if active_station is not None and active_station not in stations:
+            print(f"Info: Station {active_station.label} was removed")
+            active_station.stop()
+            active_station = None
+        station_num = stations.index(active_station) if active_station is not None else None
+        total_station_num = len(station_data_list)
+        if total_station_num:
+            tuning_seperation = round(settings.MOTOR_SETTINGS["range"] / total_station_num, 1)
+        tuning_table = dial.build_tuning_table(total_station_num) if total_station_num > 1 else None
+        if pending_station is not None and pending_station[0] >= total_station_num:
+            pending_station = None
+        tuning_prev_angle = None
+        tuning_locked = False
 
+    if active_station is not None and active_station.state == active_station.STATES['stopped'] and on_off_state and not callout_active:
+        # Its song couldn't be loaded, the rescan has the files that are there now
+        active_station.live_playback()
 
 
 # Find the angular location of a radio station
 def get_station_pos(station_number):
-    global total_station_num
-
-    # Validate total_station_num
-    if total_station_num <= 1:
-        raise ValueError(f"Invalid total_station_num: {total_station_num}. Must be greater than 1.")
-
-    # Validate station_number
-    if station_number < 0 or station_number >= total_station_num:
-        raise ValueError(f"Invalid station_number: {station_number}. Must be in range 0 to {total_station_num - 1}.")
-
-    # Cache settings for clarity
-    min_angle = settings.MOTOR_SETTINGS["min_angle"]
-    max_angle = settings.MOTOR_SETTINGS["max_angle"]
-    end_zone = settings.TUNING_SETTINGS["end_zone"]
-
-    # Calculate and return the angular position
-    return round(
-        map_range(
-            station_number,
-            0, total_station_num - 1,
-            min_angle + end_zone,
-            max_angle - end_zone,
-        ),
-        1,
-    )
-
-
+    return dial.get_station_pos(station_number, total_station_num)
 
 
 # Determine the nearest radio station to a certain motor angle
 def get_nearest_station(angle):
-    global total_station_num
-
-    # Validate total_station_num
-    if total_station_num <= 1:
-        raise ValueError(f"Invalid total_station_num: {total_station_num}. Must be greater than 1.")
-
-    # Cache settings for clarity
-    min_angle = settings.MOTOR_SETTINGS["min_angle"]
-    max_angle = settings.MOTOR_SETTINGS["max_angle"]
-    end_zone = settings.TUNING_SETTINGS["end_zone"]
-
-    # Map the angle to the nearest station index and return
-    return round(
-        map_range(
-            angle,
-            min_angle + end_zone,
-            max_angle - end_zone,
-            0,
-            total_station_num - 1,
-        )
-    )
+    return dial.get_nearest_station(angle, total_station_num)
 
 
 def play_static(play=None):
@@ -637,13 +457,14 @@ def tuning(manual=False):
     if manual:
         tuning_locked = False
 
-    # Find the nearest station based on the current motor angle
-    nearest_station_num = get_nearest_station(motor_angle)
-    station_angle = get_station_pos(nearest_station_num)
-    range_to_station = abs(station_angle - motor_angle)  # Angular distance to nearest station
+    # Find the nearest station, the angular distance to it and the tuning zone from the band's tuning table
+    if tuning_table:
+        nearest_station_num, range_to_station, zone = tuning_table[dial.get_table_index(tuning_table, motor_angle)]
+    else:
+        nearest_station_num, range_to_station, zone = dial.get_tuning(motor_angle, total_station_num)
 
     # Check if we're close enough to lock onto the station
-    if range_to_station <= settings.TUNING_SETTINGS["lock_on"]:
+    if zone == dial.LOCKED:
         if not tuning_locked:
             tuning_locked = True
             tuning_volume = volume  # Set volume to normal
@@ -653,7 +474,7 @@ def tuning(manual=False):
             static_playback_active = False  # Ensure static remains stopped
 
     # Check if we're close to a station (but not locked)
-    elif range_to_station < settings.TUNING_SETTINGS["near"]:
+    elif zone == dial.NEAR:
         tuning_volume = clamp(round(volume / range_to_station, 3), settings.VOLUME_SETTINGS["min"], 1)
         pygame.mixer.music.set_volume(tuning_volume)
 
@@ -667,7 +488,7 @@ def tuning(manual=False):
     # If not near any station, play only static
     else:
         if active_station:
-            # print(f"Tuning: No active station. Nearest station: #{nearest_station_num}, Angle: {station_angle}, Needle: {motor_angle}, Separation: {tuning_seperation}")
+            # print(f"Tuning: No active station. Nearest station: #{nearest_station_num}, Distance: {range_to_station}, Needle: {motor_angle}, Separation: {tuning_seperation}")
             active_station.stop()
             pygame.mixer.music.stop()
             active_station = None
@@ -706,10 +527,26 @@ def prev_station():
         print(f"Tuning: Previous station {station_num} / {total_station_num}")
     select_station(station_num, True)
 
-def select_band(new_band_num):
+def find_band_with_stations(band_num, step=1):
+    """
+    Returns the first band from band_num in the direction of step that has stations, loading the bands on the way.
+    Bands whose folders were emptied since the library index was saved are skipped. Searches the other way
+    if there is none in that direction, returns None if no band has any stations.
+    """
+    for first_band, direction in ((band_num, step), (band_num - step, -step)):
+        for band_number in range(first_band, radio_band_total if direction > 0 else -1, direction):
+            library.load_bands(radio_band_list, [band_number])  # Loads the band on first use
+            if radio_band_list[band_number]["stations"]:
+                return band_number
+            print(f"Info: Band {radio_band_list[band_number]['folder_name']} has no stations, skipping it")
+    return None
+
+
+def select_band(new_band_num, step=1):
     global radio_band, total_station_num, tuning_seperation
     global radio_band_total, station_list, stations
-    global active_station, volume, snd_band, total_station_num, on_off_state
+    global active_station, volume, total_station_num, on_off_state
+    global prewarm_targets, callout_active, callout_deadline, pending_station, tuning_table
 
     print(f"select_band: DEBUG: select_band called with new_band_num={new_band_num}, type={type(new_band_num)}")
 
@@ -721,6 +558,12 @@ def select_band(new_band_num):
         print("select_band: ERROR: Selected an invalid band number:", new_band_num, "/", radio_band_total)
         return
 
+    new_band_num = find_band_with_stations(new_band_num, step)
+    if new_band_num is None:
+        print("select_band: ERROR: No band has any stations.")
+        return
+
+    band_change_start = time.perf_counter()
     play_static(False)
     if active_station:
         active_station.stop()
@@ -728,6 +571,8 @@ def select_band(new_band_num):
 
     radio_band = new_band_num
     print("select_band: Changing to band number", new_band_num)
+    prewarm_targets = ()  # Station numbers now refer to the new band
+    pending_station = None
 
     try:
         band_data = radio_band_list[new_band_num]  # Expecting a dictionary now
@@ -742,41 +587,39 @@ def select_band(new_band_num):
         if not station_data_list:
             print(f"select_band: ERROR: No stations found in band {new_band_num}.")
             total_station_num = 0  # No stations found, prevent further actions
+            tuning_table = None
+            stations = []
             return  # Early return to avoid using an invalid station list
 
         # Set the total number of stations
         total_station_num = len(station_data_list)
         tuning_seperation = round(settings.MOTOR_SETTINGS["range"] / total_station_num, 1)
         print("Info: Tuning angle separation =", tuning_seperation, "Number of stations:", total_station_num)
+        tuning_table = dial.build_tuning_table(total_station_num) if total_station_num > 1 else None
 
-        # Initialize the stations list with RadioClass instances
-        stations = []
-        for station_data in station_data_list:
-            try:
-                station = RadioClass(station_data)
-                stations.append(station)
-            except Exception as e:
-                print(f"select_band: ERROR: Failed to initialize RadioClass for station: {station_data.get('station_name', 'Unknown')}, error: {str(e)}")
-
-        print(f"select_band: Total stations loaded: {total_station_num}")
+        stations = get_band_stations(new_band_num, station_data_list)
+        print(f"select_band: Total stations loaded: {total_station_num}, in {round((time.perf_counter() - band_change_start) * 1000, 2)} ms")
 
         if on_off_state:
             # Play band change sound
             channel = pygame.mixer.Channel(4)
-            channel.play(snd_band)
+            channel.play(sound_cache.get(settings.SOUND_EFFECTS["band_change"]))
             channel.set_volume(volume * settings.VOLUME_SETTINGS["band_change"])
 
             if settings.BAND_CALLOUT_SETTINGS["enabled"]:
                 # Audible Band callout
                 band_callout_path = os.path.join(folder_path, settings.BAND_CALLOUT_SETTINGS["file"])
                 if os.path.exists(band_callout_path):
-                    band_callout_sound = pygame.mixer.Sound(band_callout_path)
+                    band_callout_sound = sound_cache.get(band_callout_path)
                     channel = pygame.mixer.Channel(3)
                     channel.play(band_callout_sound)
                     channel.set_volume(volume * settings.VOLUME_SETTINGS["callout_volume"])
                     if settings.BAND_CALLOUT_SETTINGS["wait_for_completion"]:
-                        while channel.get_busy():  # Wait until the callout sound is finished
-                            time.sleep(0.01)
+                        # The main loop keeps running, the station starts when the channel posts CALLOUT_END
+                        channel.set_endevent(settings.EVENTS['CALLOUT_END'])
+                        callout_active = True
+                        callout_deadline = time.time() + band_callout_sound.get_length() + 1
+                    sound_cache.report()
                 else:
                     print(f"select_band: ERROR: Band callout file does not exist at {band_callout_path}")
                 
@@ -788,8 +631,57 @@ def select_band(new_band_num):
 
 
 
+def get_band_stations(band_num, station_data_list):
+    """
+    Returns the RadioClass instances of a band. The stations of recently used bands are kept in station_pool,
+    so going back to a band reuses them along with their play position and play order.
+    """
+    pooled_data_list, pooled_stations = station_pool.pop(band_num, (None, None))
+    if pooled_stations is not None and pooled_data_list is station_data_list:
+        band_stations = pooled_stations
+        print(f"Info: Reusing the {len(band_stations)} stations of band {band_num}")
+    else:
+        # A band rescanned since it was last used keeps the stations that are still there, with their new data,
+        # the stations of removed folders are dropped
+        reusable_stations = {station.path: station for station in pooled_stations or []}
+        band_stations = []
+        for station_data in station_data_list:
+            station = reusable_stations.get(station_data.get("path", ""))
+            if station is not None:
+                if station_data is not station.station_data:
+                    station.update_station_data(station_data)
+                band_stations.append(station)
+                continue
+            try:
+                band_stations.append(RadioClass(station_data))
+            except Exception as e:
+                print(f"select_band: ERROR: Failed to initialize RadioClass for station: {station_data.get('station_name', 'Unknown')}, error: {str(e)}")
+
+    station_pool[band_num] = (station_data_list, band_stations)
+    while len(station_pool) > max(settings.STATION_POOL_SIZE, 1):
+        station_pool.popitem(last=False)
+    return band_stations
+
+
+def finish_band_callout():
+    """
+    End the band callout and start the station that was selected while it played.
+    """
+    global callout_active, pending_station
+    callout_active = False
+    pygame.mixer.Channel(3).set_endevent()
+    station_selection, pending_station = pending_station, None
+    if station_selection and on_off_state:
+        select_station(*station_selection)
+
+
 def select_station(new_station_num, manual=False):
     global station_num, active_station, motor_angle, tuning_locked, stations, total_station_num
+    global pending_station
+
+    if callout_active:
+        pending_station = (new_station_num, manual)  # Started by finish_band_callout()
+        return
 
     if new_station_num == station_num and not manual:  # If the station hasn't changed, do nothing
         return
@@ -830,7 +722,12 @@ def select_station(new_station_num, manual=False):
     pygame.event.clear(settings.EVENTS['SONG_END'])
 
     # Start playback for the active station
+    start_time = time.time()
     active_station.live_playback()
+    if prefetcher and active_station.filename:
+        hit = prefetcher.check_hit(active_station.filename)
+        print(f"Select_Station: Audio started in {round((time.time() - start_time) * 1000, 1)} ms, "
+              f"{'prewarmed' if hit else 'cold'}, {prefetcher.hits} hits, {prefetcher.misses} misses")
 
 
 
@@ -879,7 +776,7 @@ def prev_band():
         play_error_snd()
     else:
         print("Tuning: Previous radio band", radio_band, "/", radio_band_total)
-        select_band(new_band)
+        select_band(new_band, -1)
         select_station(get_nearest_station(motor_angle), True)
         
 
@@ -901,7 +798,7 @@ def next_band():
 
 
 def play_error_snd():
-    pygame.mixer.Channel(4).play(snd_error)
+    pygame.mixer.Channel(4).play(sound_cache.get(settings.SOUND_EFFECTS["error"]))
     pygame.mixer.Channel(4).set_volume(volume * settings.VOLUME_SETTINGS["effects"])
 
 def shutdown_zero():
@@ -915,6 +812,10 @@ def send_uart(command_type, data1, data2="", data3="", data4="", timeout=1.0):
     """
     global uart
 
+    # The asyncio runtime reconnects in its own task, the message is dropped rather than waiting here
+    if background_reconnect and (uart is None or not uart.is_open):
+        return
+
     # Validate if UART exists
     if uart is None:
         print("DEBUG: UART object is None. Attempting to reinitialize.")
@@ -943,9 +844,9 @@ def send_uart(command_type, data1, data2="", data3="", data4="", timeout=1.0):
 
     # Attempt to send the message
     try:
-        message = f"{command_type},{data1},{data2},{data3},{data4},\n"
-        message_bytes = bytes(message, "utf-8")
-        uart.write(message_bytes)
+        with uart_send_lock:  # Keeps the frame sequence numbers in order
+            message_bytes = uart_protocol.encode(command_type, data1, data2, data3, data4)
+            uart.write(message_bytes)
         #print(f"DEBUG: UART message sent: {message.strip()}")
     except serial.SerialTimeoutException as e:
         print(f"ERROR: UART timeout during message send: {e}")
@@ -959,59 +860,33 @@ def send_uart(command_type, data1, data2="", data3="", data4="", timeout=1.0):
 
 
 def receive_uart():
-    global uart
-
-    # Validate if UART is initialized
-    # if not uart:
-        # print("DEBUG: UART object is None. Skipping receive_uart.")
-        # return []
-
-    # Validate if UART is open
-    if not uart.is_open:
-        print("DEBUG: UART is not open. Attempting to reopen.")
-        try:
-            uart.open()
-            print("INFO: UART reopened successfully.")
-        except Exception as error:
-            print(f"ERROR: Failed to reopen UART: {error}")
-            return []
+    """
+    Returns the messages the UART reader has received since the last call, as (received time, message fields).
+    """
+    return coalesce_uart_messages(uart_reader.get_messages()) if uart_reader else []
 
-    # Check for available data
-    # if uart.in_waiting == 0:
-        # print("DEBUG: No data available to read from UART.")
-        # return []
 
-    try:
-        # Read the line from UART
-        line = uart.readline()  # Read data until "\n" or timeout
-        if line:
-            #print(f"DEBUG: Raw data received: {line}")
-            line = line.decode("utf-8").strip("\n")  # Decode and clean the data
-            #print(f"DEBUG: Decoded data: {line}")
-            parsed_data = line.split(",")  # Parse data into a list
-            #print(f"DEBUG: Parsed UART data: {parsed_data}")
-            return parsed_data
+def coalesce_uart_messages(messages):
+    """
+    Keep only the newest motor and volume message of a batch, each stays where it was received among the other
+    messages. Buttons, heartbeats and power messages are all kept in order.
+    """
+    newest = {}
+    coalescable = 0
+    for index, (received_time, uart_message) in enumerate(messages):
+        if uart_message[0] in superseded_messages:
+            newest[uart_message[0]] = index
+            coalescable += 1
+    if coalescable == len(newest):
+        return messages  # Nothing superseded, the usual case when the knobs are still
+    coalesced = []
+    for index, (received_time, uart_message) in enumerate(messages):
+        message_type = uart_message[0]
+        if message_type in newest and newest[message_type] != index:
+            superseded_messages[message_type] += 1
         else:
-            #print("DEBUG: UART read returned an empty line.")
-            return []
-    except serial.SerialException as error:
-        print(f"ERROR: SerialException in receive_uart: {error}")
-        try:
-            uart.close()  # Close UART to reset on error
-            print("INFO: UART closed after exception.")
-        except Exception as close_error:
-            print(f"ERROR: Failed to close UART after exception: {close_error}")
-    except UnicodeDecodeError as decode_error:
-        print(f"ERROR: UnicodeDecodeError in receive_uart: {decode_error}")
-    except Exception as error:
-        print(f"ERROR: Unexpected error in receive_uart: {error}")
-        try:
-            uart.close()
-            print("INFO: UART closed after unexpected error.")
-        except Exception as close_error:
-            print(f"ERROR: Failed to close UART after unexpected error: {close_error}")
-
-    return []
+            coalesced.append((received_time, uart_message))
+    return coalesced
 
 
 
@@ -1029,8 +904,7 @@ def wait_for_pico():
         # Wait for a response within a timeout
         start_time = time.time()
         while time.time() - start_time < settings.UART_SETTINGS["heartbeat_timeout"]:
-            uart_message = receive_uart()  # Check for response
-            if uart_message:
+            for received_time, uart_message in receive_uart():  # Check for response
                 #print("DEBUG, wait_for_pico, uart_message=",uart_message)
                 process_uart_message(uart_message)
                 # If a valid heartbeat is received, break out of the loop
@@ -1053,8 +927,9 @@ def midnight():
     midnight = int(time.mktime(time.strptime(midnight_str, "%m/%d/%Y %H:%M:%S")))
     master_start_time = midnight
 
-    for station in stations:
-        station.reference_time = master_start_time + station.station_offset
+    for station_data_list, band_stations in station_pool.values():
+        for station in band_stations:
+            station.sync_to_live()  # Also picks up the new day's shuffled order
     print("INFO: Midnight:", str(datetime.timedelta(seconds=midnight)))
 
 schedule.every().day.at("00:00:01").do(midnight)
@@ -1123,6 +998,47 @@ def handle_motor_message(uart_message):
         #nordprint("DEBUG: handle_motor_message, motor_angle=",motor_angle)
     except (IndexError, ValueError) as error:
         print("Motor Error:", str(error))
+        return
+    if settings.PREWARM_SETTINGS["enabled"]:
+        prewarm_stations_ahead(motor_angle)
+
+
+def prewarm_stations_ahead(angle):
+    """
+    Track the needle speed and have the prefetcher read the live position of the next stations in its path,
+    so the station is already in the page cache when the needle gets close enough to play it.
+    """
+    global needle_speed, needle_prev, prewarm_targets
+    now = time.time()
+    if needle_prev and now > needle_prev[1]:
+        speed = (angle - needle_prev[0]) / (now - needle_prev[1])
+        needle_speed = 0.5 * needle_speed + 0.5 * speed
+    needle_prev = (angle, now)
+
+    if not prefetcher or total_station_num <= 1 or abs(needle_speed) < settings.PREWARM_SETTINGS["min_speed"]:
+        return
+
+    # Fractional station number under the needle, the stations ahead are the next whole numbers in the direction of travel
+    station_position = map_range(angle, settings.MOTOR_SETTINGS["min_angle"] + settings.TUNING_SETTINGS["end_zone"],
+                                 settings.MOTOR_SETTINGS["max_angle"] - settings.TUNING_SETTINGS["end_zone"], 0, total_station_num - 1)
+    if needle_speed > 0:
+        first_station = math.floor(station_position) + 1
+        targets = tuple(range(first_station, first_station + settings.PREWARM_SETTINGS["stations_ahead"]))
+    else:
+        first_station = math.ceil(station_position) - 1
+        targets = tuple(range(first_station, first_station - settings.PREWARM_SETTINGS["stations_ahead"], -1))
+    targets = tuple(target for target in targets if 0 <= target < len(stations) and target != station_num)
+    if targets == prewarm_targets:
+        return
+    prewarm_targets = targets
+
+    for order, target in enumerate(targets):
+        try:
+            file_path, start_fraction = stations[target].get_live_file()
+        except Exception as error:
+            print(f"Warning: Could not find the live file of station {target}: {error}")
+            continue
+        prefetcher.schedule(f"station_ahead_{order}", file_path, now, start_fraction)
 
 def handle_power_message(uart_message):
     if len(uart_message) > 1:
@@ -1186,20 +1102,28 @@ def load_static_sounds():
 
 
 
-def run():
-    global clock, on_off_state, snd_on, tuning_locked, restore_angle, total_station_num
-    global motor_angle, radio_band_total, radio_band_list, heartbeat_time, pico_heartbeat_time, pico_state
+def start_uart(on_message, reopen=True):
+    """
+    Get the UART opened by setup and start reading it in the background, on_message is called when messages arrive.
+    With reopen, the reader reopens a port that was closed after an error.
+    """
+    global uart, uart_reader
 
     # Ensure UART is initialized
     uart = setup.get_uart()
     if not uart:
         print("ERROR: UART not initialized. Exiting.")
         sys.exit(1)
+    uart_reader = UartReader(lambda: uart, uart_protocol, on_message, reopen)
+    uart_reader.start()
 
-    # Initial heartbeat loop until we get a successful response from Pi Pico
-    print("Waiting: Waiting for Pi Pico heartbeat")
-    while not pico_state:
-        wait_for_pico()
+
+def start_radio():
+    """
+    Load the library and the saved band and station, then go into standby. Called once the Pi Pico has answered.
+    """
+    global on_off_state, tuning_locked, restore_angle, total_station_num
+    global motor_angle, radio_band_total, radio_band_list, prefetcher
 
     # Check GPIO input if available
     if setup.gpio_available:
@@ -1208,9 +1132,9 @@ def run():
     # Static sound related
     load_static_sounds()
 
-    # Loaded the cached radio bands and stations
+    # List the radio bands, only the saved band is loaded before playback can start
     print("Info: Caching radio bands and stations...")
-    radio_band_list = get_radio_bands(settings.STATIONS_ROOT_FOLDER)
+    radio_band_list = library.list_radio_bands(settings.STATIONS_ROOT_FOLDER)
 
     # Set the total number of bands found
     radio_band_total = len(radio_band_list)
@@ -1218,7 +1142,7 @@ def run():
         print("ERROR: No radio bands found. Exiting.")
         sys.exit(1)
 
-    # Load saved settings, now that we have cached all bands and stations
+    # Load saved settings, now that we have listed all bands
     volume_settings, station_number, radio_band_number = load_saved_settings()
     set_volume_level(volume_settings)
 
@@ -1226,6 +1150,7 @@ def run():
     if radio_band_number >= radio_band_total or radio_band_number < 0:
         print(f"Warning: Saved band number {radio_band_number} is invalid. Defaulting to band 0.")
         radio_band_number = 0
+    library.load_bands(radio_band_list, [radio_band_number])
 
     # Validate station position for the selected band
     total_station_num = len(radio_band_list[radio_band_number]["stations"])
@@ -1236,14 +1161,93 @@ def run():
         print(f"Warning: Saved station number {station_number} is invalid. Defaulting to station 0.")
         station_number = 0
         
+    # Warm upcoming songs into the page cache
+    if settings.PREFETCH_SETTINGS["enabled"]:
+        prefetcher = Prefetcher(settings.PREFETCH_SETTINGS["read_bytes"])
+        prefetcher.start()
+
     print(f"Tuning: Loading saved station number {station_number}")
     # After loading settings, attempt to select the saved band and station if valid
     select_band(radio_band_number)
     #select_station(get_nearest_station(motor_angle), True)
     print("****** Radiation King Radio is now running ******")
+
+    # Load the other bands in the background
+    library.start_warmup(radio_band_list)
+
+    # Decode the band callouts in the background, so band changes don't wait on them
+    if settings.BAND_CALLOUT_SETTINGS["enabled"] and settings.SOUND_CACHE_SETTINGS["preload_callouts"]:
+        callout_paths = [os.path.join(settings.STATIONS_ROOT_FOLDER, band["folder_name"], settings.BAND_CALLOUT_SETTINGS["file"])
+                         for band in radio_band_list]
+        sound_cache.preload([path for path in callout_paths if os.path.exists(path)], settings.SCAN_SETTINGS["warmup_delay"])
+
+    # Pick up changed music without a restart
+    if settings.WATCHER_SETTINGS["enabled"]:
+        watcher.LibraryWatcher(settings.STATIONS_ROOT_FOLDER, rescan_library).start()
     
     standby(True) #Go into standby at start up
-    
+
+
+def service_radio(now, events=None):
+    """
+    Handle the UART messages and pygame events that have arrived, then update the tuning.
+    events are pygame events already taken from the queue, by default they are read here.
+    """
+    # Process every UART message received since the last loop
+    motor_message_time = None
+    for received_time, uart_message in receive_uart():
+        try:
+            #print(uart_message) # Debug
+            process_uart_message(uart_message)
+        except Exception as error:
+            print("ERROR: Error in processing UART message:", str(error))
+        if uart_message[0] == "M" and settings.UART_SETTINGS["measure_latency"]:
+            motor_message_time = received_time
+
+    # Handle pygame events
+    for event in pygame.event.get() if events is None else events:
+        handle_event(event)
+    if callout_active and now > callout_deadline:
+        print("Warning: No end event for the band callout, starting the station")
+        finish_band_callout()
+
+    # GPIO and tuning logic
+    if setup.gpio_available:
+        check_gpio_input()
+
+    check_song_gap()
+
+    # Radio tuning, held back while a band callout plays
+    if on_off_state and not callout_active:
+        tuning()
+        play_static()
+        if motor_message_time is not None:
+            report_tuning_latency(motor_message_time)
+
+
+def report_loop_stall(start_time):
+    # Report loops slow enough to delay UART messages and tuning
+    loop_time = time.time() - start_time
+    if loop_time > settings.LOOP_STALL_WARNING:
+        print(f"Warning: Main loop stalled for {round(loop_time * 1000, 1)} ms")
+
+
+def run():
+    global heartbeat_time, pico_heartbeat_time
+
+    if settings.MAIN_LOOP_SETTINGS["runtime"] == "asyncio":
+        asyncio.run(run_async())
+        return
+
+    start_uart(lambda: pygame.event.post(pygame.event.Event(settings.EVENTS['UART_MESSAGE'])))
+
+    # Initial heartbeat loop until we get a successful response from Pi Pico
+    print("Waiting: Waiting for Pi Pico heartbeat")
+    while not pico_state:
+        wait_for_pico()
+
+    start_radio()
+
     try:
         while True:
             now = time.time()
@@ -1257,37 +1261,24 @@ def run():
                 wait_for_pico()
                 pico_heartbeat_time = now
 
-            # Receive UART message
-            uart_message = receive_uart()
-
-            # Process received UART message during normal operation
-            if uart_message:
-                try:
-                    #print(uart_message) # Debug
-                    process_uart_message(uart_message)
-                except Exception as error:
-                    print("ERROR: Error in processing UART message:", str(error))
-
-            # Handle pygame events
-            for event in pygame.event.get():
-                handle_event(event)
-
-            # GPIO and tuning logic
-            if setup.gpio_available:
-                check_gpio_input()
-
-            # Radio tuning
-            if on_off_state:
-                tuning()
-                play_static()
+            service_radio(now)
 
             # Send heartbeat to Pico if necessary
             if now - heartbeat_time > settings.UART_SETTINGS["heartbeat_interval"]:
                 send_uart("H", "Zero")
                 heartbeat_time = now
 
-            # Maintain consistent loop rate (adjust as needed)
-            clock.tick(settings.TICK)
+            report_loop_stall(now)
+
+            if settings.MAIN_LOOP_SETTINGS["event_driven"]:
+                # Sleep until a pygame event, a UART message or the next timer
+                # Rounded up to at least 1 ms, pygame waits forever for a timeout of 0
+                event = pygame.event.wait(max(1, math.ceil(get_loop_sleep() * 1000)))
+                if event.type != pygame.NOEVENT:
+                    handle_event(event)
+            else:
+                # Maintain consistent loop rate (adjust as needed)
+                clock.tick(settings.TICK)
     except KeyboardInterrupt:
         print("KeyboardInterrupt received, exiting...")
         exit_script()  # Call cleanup function
@@ -1297,12 +1288,195 @@ def run():
 
 
 
+def get_loop_sleep():
+    """
+    Seconds until the main loop has something to do without an event: a heartbeat, a scheduled job or a timeout.
+    """
+    now = time.time()
+    deadlines = [heartbeat_time + settings.UART_SETTINGS["heartbeat_interval"],
+                 pico_heartbeat_time + settings.UART_SETTINGS["heartbeat_timeout"]]
+    if callout_active:
+        deadlines.append(callout_deadline)
+    idle_seconds = schedule.idle_seconds()
+    if idle_seconds is not None:
+        deadlines.append(now + idle_seconds)
+    max_sleep = settings.MAIN_LOOP_SETTINGS["gpio_poll_interval"] if setup.gpio_available else settings.MAIN_LOOP_SETTINGS["max_sleep"]
+    return clamp(min(deadlines) - now, 0, max_sleep)
+
+
+async def run_async():
+    """
+    The main loop as asyncio tasks, see MAIN_LOOP_SETTINGS. Heartbeats, the Pi Pico timeout, UART reconnection and
+    scheduled jobs each run on their own timer, so waiting on the Pico never holds up tuning, buttons or playback.
+    Everything that changes the radio runs one call at a time on the radio thread, so a band scan or a song load
+    there doesn't hold up the heartbeats and timeouts on the event loop.
+    """
+    global background_reconnect, radio_executor
+
+    loop = asyncio.get_running_loop()
+    uart_wake = asyncio.Event()
+    radio_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="radio")
+
+    def wake_control_task():
+        try:
+            loop.call_soon_threadsafe(uart_wake.set)
+        except RuntimeError:
+            pass  # The loop has closed during shutdown
+
+    start_uart(wake_control_task, reopen=False)  # uart_connection_task reopens the port
+    background_reconnect = True
+
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    tasks = [asyncio.create_task(heartbeat_task()), asyncio.create_task(uart_connection_task())]
+
+    # Handle the Pico's messages until it answers a heartbeat
+    print("Waiting: Waiting for Pi Pico heartbeat")
+    while not pico_state and not stop.is_set():
+        await wait_for_uart(uart_wake, 0.1)
+        await run_on_radio(process_uart_messages)
+
+    if not stop.is_set():
+        print("wait_for_pico: Heartbeat acknowledged by Pi Pico")
+        startup = asyncio.create_task(run_on_radio(start_radio))
+        await asyncio.wait([startup, asyncio.create_task(stop.wait())], return_when=asyncio.FIRST_COMPLETED)
+        if startup.done() and not stop.is_set():
+            startup.result()
+            tasks += [asyncio.create_task(control_task(uart_wake)),
+                      asyncio.create_task(pico_watchdog_task()),
+                      asyncio.create_task(schedule_task())]
+            await stop.wait()
+
+    print("Info: Stopping the asyncio tasks")
+    setup.exit_requested = True  # Ends a UART reconnection that is still retrying
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    radio_executor.shutdown(wait=True)  # Lets a radio call that is still running finish before the shutdown sequence
+
+
+async def run_on_radio(function, *args):
+    # Run function on the radio thread, calls run one at a time in the order they were made
+    return await asyncio.get_running_loop().run_in_executor(radio_executor, function, *args)
+
+
+def process_uart_messages():
+    # Handle the messages received while waiting for the Pi Pico
+    for received_time, uart_message in receive_uart():
+        try:
+            process_uart_message(uart_message)
+        except Exception as error:
+            print("ERROR: Error in processing UART message:", str(error))
+
+
+async def wait_for_uart(uart_wake, timeout):
+    # Returns when the UART reader has new messages or after timeout seconds
+    try:
+        await asyncio.wait_for(uart_wake.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    uart_wake.clear()
+
+
+def service_radio_pass(events):
+    # One control task pass on the radio thread
+    now = time.time()
+    service_radio(now, events)
+    report_loop_stall(now)
+
+
+async def control_task(uart_wake):
+    """
+    UART messages, pygame events and tuning. Wakes for UART messages and polls pygame events, which can't be awaited.
+    Events are taken from the queue on the event loop, SDL expects that on the thread that started it.
+    """
+    while True:
+        await wait_for_uart(uart_wake, settings.MAIN_LOOP_SETTINGS["event_poll_interval"])
+        try:
+            await run_on_radio(service_radio_pass, pygame.event.get())
+        except Exception as error:
+            print(f"ERROR: Exception in the control task: {error}")
+
+
+async def heartbeat_task():
+    # Send heartbeats to the Pi Pico, also while waiting for it to answer
+    global heartbeat_time
+
+    while True:
+        send_uart("H", "Zero")
+        heartbeat_time = time.time()
+        await asyncio.sleep(settings.UART_SETTINGS["heartbeat_interval"])
+
+
+async def pico_watchdog_task():
+    """
+    Go into standby when the Pi Pico stops sending heartbeats. The heartbeats keep being sent and the Pico's answer is
+    handled by the control task, so nothing waits for it here.
+    """
+    global pico_state, pico_heartbeat_time
+
+    while True:
+        timeout_time = pico_heartbeat_time + settings.UART_SETTINGS["heartbeat_timeout"]
+        if time.time() > timeout_time:
+            print("wait_for_pico: Timeout: No response from Pi Pico. Waiting for it in standby")
+            pico_state = False
+            pico_heartbeat_time = time.time()
+            try:
+                await run_on_radio(standby)
+            except Exception as error:
+                print(f"ERROR: Exception going into standby: {error}")
+            continue
+        await asyncio.sleep(timeout_time - time.time())
+
+
+async def schedule_task():
+    # Run the scheduled jobs, the midnight resync, when they are due
+    while True:
+        try:
+            await run_on_radio(schedule.run_pending)
+        except Exception as error:
+            print(f"ERROR: Exception in a scheduled job: {error}")
+        idle_seconds = schedule.idle_seconds()
+        await asyncio.sleep(clamp(idle_seconds if idle_seconds is not None else 60, 0, 60))
+
+
+def reconnect_uart():
+    """
+    Open the UART again after it failed or was closed, called from a worker thread by uart_connection_task.
+    """
+    global uart
+    try:
+        if uart is None:
+            setup.open_serial_connection()
+            uart = setup.get_uart()
+        else:
+            uart.open()
+        if uart and uart.is_open:
+            print("INFO: UART reopened successfully.")
+    except Exception as e:
+        print(f"ERROR: Failed to reopen UART: {e}")
+
+
+async def uart_connection_task():
+    """
+    Check the UART every second and reopen it in a worker thread when it failed or was closed. The UART reader closes
+    the port on a read error. send_uart drops messages until it is open again.
+    """
+    while True:
+        if uart is None or not uart.is_open:
+            await asyncio.get_running_loop().run_in_executor(None, reconnect_uart)
+        await asyncio.sleep(1)
+
+
 def process_button_action(button_id, action_type="press"):
     """Handle both press and hold actions for buttons."""
     if not isinstance(button_id, str):
         print(f"ERROR: Button identifier should be a string, but got {type(button_id)}")
         return
 
+    # Button ids count from 0, the README numbers the buttons from 1, so id "2" is button 3
     if action_type == "press":
         if button_id == "0" and active_station: active_station.rewind()
         if button_id == "1": prev_station()
@@ -1315,8 +1489,7 @@ def process_button_action(button_id, action_type="press"):
         if button_id == "0" and active_station: active_station.prev_song()
         if button_id == "1": prev_band()
         if button_id == "2" and active_station:
-            active_station.toggle_order()  # Toggle between ordered and random
-            active_station.next_song()  # Go to the next song after toggling
+            active_station.toggle_order()  # Toggle between ordered and random, playing from the live position
         if button_id == "3": next_band()
         if button_id == "4" and active_station: active_station.next_song()
     else:
@@ -1325,6 +1498,53 @@ def process_button_action(button_id, action_type="press"):
 
 
 
+def mark_song_end():
+    # Called on SONG_END, the mixer posts it as the song's last buffer is finished
+    if settings.PLAYBACK_SETTINGS["measure_gaps"]:
+        song_gaps["end_time"] = time.time()
+
+
+def check_song_gap():
+    """
+    Once the mixer plays the song after a SONG_END, print the silence between them, with running totals.
+    The next song started get_pos() ms ago, get_pos() counts the audio mixed since play() or since a queued song began,
+    so the result doesn't depend on how soon after the start this runs.
+    """
+    if song_gaps["end_time"] is None:
+        return
+    play_position = pygame.mixer.music.get_pos()
+    if play_position <= 0 or not pygame.mixer.music.get_busy():
+        return  # Not started yet, nothing has been mixed
+    report_song_gap(song_gaps["end_time"], time.time() - play_position / 1000)
+    song_gaps["end_time"] = None
+
+
+def report_song_gap(song_end_time, next_start_time):
+    """
+    Print the time between the end event of a song and the start of the next one, with running totals.
+    A queued song starts in the same mixer callback that ends the last one, so its gap is 0.
+    """
+    gap = max(next_start_time - song_end_time, 0.0)
+    song_gaps["count"] += 1
+    song_gaps["total"] += gap
+    song_gaps["max"] = max(song_gaps["max"], gap)
+    print(f"Gap: {round(gap * 1000, 1)} ms, average {round(song_gaps['total'] / song_gaps['count'] * 1000, 1)} ms, "
+          f"max {round(song_gaps['max'] * 1000, 1)} ms over {song_gaps['count']} songs")
+
+
+def report_tuning_latency(motor_message_time):
+    """
+    Print the time from receiving an M message to tuning() acting on the new angle.
+    """
+    latency = time.perf_counter() - motor_message_time
+    tuning_latency["count"] += 1
+    tuning_latency["total"] += latency
+    tuning_latency["max"] = max(tuning_latency["max"], latency)
+    print(f"Latency: {round(latency * 1000, 2)} ms, average {round(tuning_latency['total'] / tuning_latency['count'] * 1000, 2)} ms, "
+          f"max {round(tuning_latency['max'] * 1000, 2)} ms over {tuning_latency['count']} motor messages, "
+          f"{superseded_messages['M']} superseded")
+
+
 class Radiostation:
     global volume, tuning_volume, master_start_time
     STATES = {
@@ -1332,17 +1552,29 @@ class Radiostation:
         'playing': 1,
         'paused': 2
     }
+    # Stations are kept for every station of a band, slots leave out the per instance __dict__
+    __slots__ = ("label", "directory", "files", "song_lengths", "timeline", "play_order", "song_index", "is_ordered",
+                 "ordered_timeline", "shuffled_order", "shuffled_timeline", "shuffle_day", "total_length",
+                 "song_length", "state", "filename", "last_filename", "reference_time", "position", "sum_of_song_lengths",
+                 "station_angle", "last_play_position", "last_playtime", "station_offset", "queued_file", "seek_tables")
 
     def __init__(self, *args, **kwargs):
 
         self.label = None
         self.directory = None
-        self.files = deque()
-        self.song_lengths = deque()
+        self.files = []  # Shared with the band list, never changed in place
+        self.song_lengths = array('d')  # Shared with the band list, never changed in place
+        self.timeline = StationTimeline([])
+        self.play_order = None  # Indexes into files in play order when shuffled, None when ordered
+        self.song_index = 0  # Index of the current song in the play order and timeline
+        self.is_ordered = True
+        self.ordered_timeline = self.timeline
+        self.shuffled_order = None  # The shuffled play order and its timeline are built once a day, on first use
+        self.shuffled_timeline = None
+        self.shuffle_day = None
         self.total_length = []
         self.song_length = 0
         self.state = self.STATES['stopped']
-        self.station_length = 0
         self.filename = 0
         self.last_filename = None
         self.reference_time = 0
@@ -1352,46 +1584,161 @@ class Radiostation:
         self.last_play_position = 0
         self.last_playtime = 0
         self.station_offset = 0
+        self.queued_file = None  # The song queued in the mixer to follow the current one
+        self.seek_tables = {}  # File name to the seek table of long files, from the library index
         pygame.mixer.music.set_endevent(settings.EVENTS['SONG_END'])
 
+    def get_file_index(self, song_index):
+        return self.play_order[song_index] if self.play_order is not None else song_index
+
+    def get_song_index(self, file_index):
+        return self.play_order.index(file_index) if self.play_order is not None else file_index
+
+    def update_play_order(self):
+        """
+        Switch to the play order of the current mode, returns True if it changed.
+        The shuffled order only depends on the station, the day and SHUFFLE_SEED, so radios sharing a seed stay in sync.
+        """
+        if self.is_ordered:
+            play_order, timeline = None, self.ordered_timeline
+        else:
+            day = datetime.date.today().isoformat()
+            if self.shuffle_day != day:
+                self.shuffled_order = get_shuffled_order(len(self.files), f"{self.directory}/{self.label}", day, settings.SHUFFLE_SEED)
+                self.shuffled_timeline = StationTimeline(self.song_lengths[file_index] for file_index in self.shuffled_order)
+                self.shuffle_day = day
+            play_order, timeline = self.shuffled_order, self.shuffled_timeline
+        changed = timeline is not self.timeline
+        self.play_order, self.timeline = play_order, timeline
+        return changed
+
+    def sync_to_live(self):
+        """
+        Move to the song and position the station is at right now, counting from its start time.
+        """
+        global master_start_time
+        self.update_play_order()
+        current_time = time.time()
+        elapsed_time = current_time - (master_start_time + self.station_offset)
+        self.song_index, self.position = self.timeline.locate(max(elapsed_time, 0))
+        self.reference_time = current_time - self.position
+        if self.queued_file:
+            self.queue_next_song()  # The song after the current one may have changed
+
+    def get_live_file(self):
+        """
+        Returns the file the station would play right now and how far into it, as a fraction, without playing it.
+        """
+        if self.update_play_order():
+            self.sync_to_live()
+        elapsed_time = max(time.time() - self.reference_time, 0)
+        song_index, position = self.timeline.locate(self.timeline.song_start(self.song_index) + elapsed_time)
+        song_length = self.timeline.song_length(song_index)
+        return self.files[self.get_file_index(song_index)], position / song_length if song_length else 0
+
     def live_playback(self):
         global volume
         if self.files:
-
-            #Update position based on time that has passed
-            self.position = time.time() - self.reference_time
-
-            #  Subtract time until we are below the station length
-            if self.station_length and self.position > self.station_length:
-                #print("Info: position:",round(self.position, 3),"longer than station length:",round(self.song_length, 3))
-                while self.position > self.station_length:
-                    print("Info: Looping station list")
-                    self.position = self.position - self.station_length
-
-            #  Find where in the station list we should be base on start position
-            self.song_length = self.song_lengths[0]  # length of the current song
-            if self.song_length and self.position > self.song_length:
-                print("Info: Position:",round(self.position, 3),"is longer than the song length:",round(self.song_length, 3),"skipping ahead")
-
-                #  Skip ahead until we reach the correct time
-                while self.position > self.song_length:
-                    self.files.rotate(-1)
-                    self.song_lengths.rotate(-1)
-                    self.position = self.position - self.song_length
-                    self.song_length = self.song_lengths[0]
-                self.reference_time = time.time() - self.position
-
-            self.filename = self.files[0]
+            # A station tuned to for the first time today in random mode gets its shuffled order here
+            if self.update_play_order():
+                self.sync_to_live()
+
+            #  reference_time is when the current song started, find where that puts us in the station loop
+            current_time = time.time()
+            elapsed_time = max(current_time - self.reference_time, 0)
+            song_index, self.position = self.timeline.locate(self.timeline.song_start(self.song_index) + elapsed_time)
+            if song_index != self.song_index:
+                print("Info: Skipped ahead from song", self.song_index, "to", song_index, "position:", round(self.position, 3))
+                self.song_index = song_index
+            self.reference_time = current_time - self.position
+            file_index = self.get_file_index(self.song_index)
+            self.song_length = self.song_lengths[file_index]  # length of the current song
+
+            self.filename = self.files[file_index]
             song = self.filename
 
-            pygame.mixer.music.load(song)
-            try:
-                pygame.mixer.music.play(0, self.position)
-            except:
-                pygame.mixer.music.play(0, 0)
+            if not self.start_from_seek_table(song, current_time):
+                try:
+                    pygame.mixer.music.load(song)
+                except pygame.error as error:
+                    # Deleted or replaced since the last scan, the library watcher rescans the station and restarts it
+                    print(f"Warning: Could not load {song}: {error}")
+                    self.state = self.STATES['stopped']
+                    return
+                try:
+                    pygame.mixer.music.play(0, self.position)
+                except:
+                    pygame.mixer.music.play(0, 0)
             pygame.mixer.music.set_volume(volume)
 
             self.state = self.STATES['playing']
+            self.queue_next_song()
+
+    def start_from_seek_table(self, song, current_time):
+        """
+        Start a long song at the page its seek table gives for the current position, the decoder is handed
+        the header pages followed by that page so it doesn't have to search the file. Returns False if not possible.
+        """
+        seek_table = self.seek_tables.get(os.path.basename(song))
+        if not seek_table or not settings.SEEK_TABLE_SETTINGS["direct_start"] or self.position < seek_table["interval"]:
+            return False
+        try:
+            start_time, offset = library.find_seek_entry(seek_table, self.position)
+            pygame.mixer.music.load(library.OggPageStream(song, seek_table["audio_start"], offset), "ogg")
+            pygame.mixer.music.play(0, 0)
+        except Exception as error:
+            print(f"Warning: Could not start {song} from its seek table: {error}")
+            return False
+        # Playback starts at the page, slightly before the live position, the station clock follows it
+        self.position = start_time
+        self.reference_time = current_time - start_time
+        return True
+
+    def queue_next_song(self):
+        """
+        Queue the next song of the timeline in the mixer, it starts as soon as the current song ends.
+        Loading or stopping music drops the queued song, so this is called again after every play().
+        The prefetcher is told to warm the next song a little before the current one ends.
+        """
+        self.queued_file = None
+        if not self.files:
+            return
+        next_file = self.files[self.get_file_index((self.song_index + 1) % len(self.files))]
+        if prefetcher:
+            prefetcher.schedule("next_song", next_file, self.reference_time + self.song_length - settings.PREFETCH_SETTINGS["lead_time"])
+        if not settings.PLAYBACK_SETTINGS["gapless"]:
+            return
+        try:
+            pygame.mixer.music.queue(next_file)
+            self.queued_file = next_file
+        except pygame.error as error:
+            print(f"Warning: Could not queue {next_file}: {error}")
+
+    def song_ended(self):
+        """
+        Handle SONG_END. A queued song is already playing, so only the live reference time is moved on.
+        Without one the next song is loaded as before.
+        """
+        mark_song_end()
+        if not self.queued_file:
+            self.next_song()
+            self.report_prefetch()
+            return
+
+        self.song_index = (self.song_index + 1) % len(self.files)
+        self.filename = self.queued_file
+        self.song_length = self.song_lengths[self.get_file_index(self.song_index)]
+        self.position = 0
+        # get_pos() counts from the start of the queued song, so the delay of this event doesn't shift the station
+        self.reference_time = time.time() - max(pygame.mixer.music.get_pos(), 0) / 1000
+        print("Info: Playing queued song =", self.filename, "length =", str(round(self.song_length, 2)))
+        self.report_prefetch()
+        self.queue_next_song()
+
+    def report_prefetch(self):
+        if prefetcher:
+            hit = prefetcher.check_hit(self.filename)
+            print(f"Prefetch: {'Hit' if hit else 'Miss'}, {prefetcher.hits} hits, {prefetcher.misses} misses")
 
 
     def play(self):
@@ -1426,107 +1773,65 @@ class Radiostation:
             self.last_play_position = pygame.mixer.music.get_pos()
             self.last_playtime = time.time()
         pygame.mixer.music.stop()
+        self.queued_file = None  # Stopping drops the queued song
+        song_gaps["end_time"] = None  # The song that ended isn't followed by another
         # print("Music stopped")
 
 
     def next_song(self):
         global volume
-        self.files.rotate(-1)
-        self.song_lengths.rotate(-1)
+        self.song_index = (self.song_index + 1) % len(self.files)
         self.reference_time = time.time()
         self.position = 0
-        self.filename = self.files[0]
+        file_index = self.get_file_index(self.song_index)
+        self.filename = self.files[file_index]
+        self.song_length = self.song_lengths[file_index]
         song = self.filename
 
         print("Info: Playing next song =", self.filename,
-              "length =", str(round(self.song_lengths[0], 2)),
+              "length =", str(round(self.song_lengths[file_index], 2)),
               "position =", str(round(self.position, 2))
               )
-        pygame.mixer.music.load(song)
+        try:
+            pygame.mixer.music.load(song)
+        except pygame.error as error:
+            print(f"Warning: Could not load {song}: {error}")
+            self.state = self.STATES['stopped']
+            return
         try:
             pygame.mixer.music.play(0, self.position)
         except:
             pygame.mixer.music.play(0, 0)
         pygame.mixer.music.set_volume(volume)
         self.state = self.STATES['playing']
+        self.queue_next_song()
 
 
     def prev_song(self):
-        self.files.rotate(1)
-        self.song_lengths.rotate(1)
+        self.song_index = (self.song_index - 1) % len(self.files)
         self.reference_time = time.time()
         self.position = 0
         self.live_playback()
         print("Action: Prev song")
 
     def randomize_station(self):
-        seed = time.time() # Using time to shuffle the stations allows two radios to be in sync, but still randomized.
-        random.Random(seed).shuffle(self.files)
-        random.Random(seed).shuffle(self.song_lengths)
         self.is_ordered = False  # Set mode to random
+        self.sync_to_live()
         print("Info: Randomized song order")
 
     def order_station(self):
         self.is_ordered = True
+        self.sync_to_live()
+        print("Info: Ordered station, restored playback position")
 
-        # Reload station data from the cache
-        cache_file = os.path.join(self.path, "station.ini")
-        station_ini_parser = configparser.ConfigParser()
-
-        if os.path.exists(cache_file):
-            try:
-                station_ini_parser.read(cache_file)
-                if station_ini_parser.has_section("cache"):
-                    station_data = json.loads(station_ini_parser.get("cache", "station_data"))
-                    self.files = deque(station_data["station_files"])
-                    self.song_lengths = deque(station_data["station_lengths"])
-                    self.station_offset = station_data.get("station_start", 0)
-                    print("Info: Station data reloaded from cache successfully")
-            except Exception as e:
-                print(f"Error loading station data from cache: {str(e)}")
-
-        # Recalculate the playback position based on the reference time
-        current_time = time.time()
-        elapsed_time = current_time - (master_start_time + self.station_offset)
-
-        # If the total station length is valid and elapsed_time is positive
-        total_station_length = sum(self.song_lengths)
-        if total_station_length > 0 and elapsed_time > 0:
-            # Calculate the current position within the total station length
-            self.position = elapsed_time % total_station_length
-
-            # Iterate over song lengths to find the correct song and position within it
-            accumulated_length = 0
-            for i, length in enumerate(self.song_lengths):
-                if accumulated_length + length > self.position:
-                    # Rotate the deques to start from the correct song
-                    self.files.rotate(-i)
-                    self.song_lengths.rotate(-i)
-                    # Adjust self.position to be the position within the current song
-                    self.position -= accumulated_length
-                    break
-                accumulated_length += length
-
-        # Reset reference_time to align with the current position
-        self.reference_time = current_time - self.position
-
-        # Use live_playback to start playing from the correct position
-        self.live_playback()
-
-        print("Info: Reloaded and ordered station from cache, restored playback position")
-
-
-
-
-
-
-        
     def toggle_order(self):
         if self.is_ordered:
             self.randomize_station()
         else:
             self.order_station()
 
+        # Both orders follow the station clock, play from the live position of the new order
+        self.live_playback()
         print(f"Info: Toggled order mode. is_ordered={self.is_ordered}")
 
     def fast_forward(self):
@@ -1545,6 +1850,8 @@ class Radiostation:
         self.live_playback()
 
 class RadioClass(Radiostation):
+    __slots__ = ("station_data", "path", "ordered")
+
     def __init__(self, station_data, *args, **kwargs):
         global master_start_time
 
@@ -1555,12 +1862,16 @@ class RadioClass(Radiostation):
                 print("station_data=", station_data)
                 raise TypeError(f"Expected station_data to be a dictionary, got {type(station_data)} instead")
 
+            self.station_data = station_data
             self.path = station_data.get('path', '')
             self.label = station_data.get('station_name', 'Unknown')
             self.directory = station_data.get('folder_name', 'Unknown')
-            self.files = deque(station_data.get('station_files', []))
+            self.files = station_data.get('station_files', [])
             self.ordered = station_data.get('station_ordered', False)
-            self.song_lengths = deque(station_data.get('station_lengths', []))
+            self.song_lengths = station_data.get('station_lengths', array('d'))
+            self.ordered_timeline = station_data.get('timeline') or StationTimeline(self.song_lengths)  # Shared with the band list
+            self.seek_tables = station_data.get('seek_tables', {})
+            self.timeline = self.ordered_timeline
             self.total_length = station_data.get('total_length', 0)
             self.station_offset = station_data.get('station_start', 0)
             self.reference_time = master_start_time + self.station_offset
@@ -1575,6 +1886,27 @@ class RadioClass(Radiostation):
         except Exception as e:
             print(f"Error: Exception during RadioClass initialization: {str(e)}")
 
+    def update_station_data(self, station_data):
+        """
+        Swap in rescanned station data, the current song keeps playing and stays at the front of the list.
+        """
+        current_file = self.files[self.get_file_index(self.song_index)] if self.files else None
+        self.station_data = station_data
+        self.files = station_data.get('station_files', [])
+        self.song_lengths = station_data.get('station_lengths', array('d'))
+        self.total_length = station_data.get('total_length', 0)
+        self.station_offset = station_data.get('station_start', 0)
+        self.seek_tables = station_data.get('seek_tables', {})
+        self.ordered_timeline = station_data.get('timeline') or StationTimeline(self.song_lengths)
+        self.shuffle_day = None  # The shuffled order is rebuilt for the new file list
+        self.update_play_order()
+        self.song_index = 0
+        if current_file in self.files:
+            self.song_index = self.get_song_index(self.files.index(current_file))
+        if self.queued_file:
+            self.queue_next_song()  # The queued file may have been replaced or deleted by the change that was rescanned
+        print(f"Info: Updated {self.label}, {len(self.files)} songs")
+
 
 
 def save_settings():
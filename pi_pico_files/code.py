@@ -8,6 +8,7 @@ import supervisor
 from adafruit_simplemath import map_range, constrain
 import atexit
 import usb_cdc
+from uart_protocol import UartProtocol
 
 ## globals:
 # ADC Related:
@@ -35,31 +36,28 @@ uart_heartbeat_time = 0
 pi_zero_heartbeat_time = 0
 usb_cdc.console.timeout = settings.UART_TIMEOUT
 usb_cdc.data.timeout = settings.UART_TIMEOUT
-uart_line = None
+uart_protocol = UartProtocol(settings.UART_BINARY_PROTOCOL)
+uart_messages = []  # Received messages not handled yet, several can arrive in one read
 brightness_smoothed = 1
 button_hold = False # prevent button input
 
 def receive_uart():
-    global uart_line
+    global uart_messages
     try:
         if usb_cdc.data.connected and usb_cdc.data.in_waiting:
             available = usb_cdc.data.in_waiting
             while available:
-                uart_line = usb_cdc.data.read(available)
+                uart_messages += uart_protocol.feed(usb_cdc.data.read(available))  # Binary frames or CSV lines
                 available = usb_cdc.data.in_waiting
-
-            if uart_line:
-                #print("DEBUG: UART_LINE:", uart_line)
-                if type(uart_line) is bytes:
-                    uart_line = uart_line.decode("utf-8")  # Convert from bytes to string
-                uart_line = uart_line.strip("\n")  # Strip end line
-                return "".join(uart_line).split(",")  # Split into array of commands
+        if uart_messages:
+            #print("DEBUG: UART message:", uart_messages[0])
+            return uart_messages.pop(0)  # One message per loop, the rest wait in order
     except Exception as e:
         print("ERROR: Uart error Pico receive_uart:", e)
 
 def send_uart(command_type, data1, data2 = "", data3 = "", data4 = ""):
     try:
-        usb_cdc.data.write(bytes(f"{command_type},{data1},{data2},{data3},{data4},\n", "utf-8")) #if using USB serial
+        usb_cdc.data.write(uart_protocol.encode(command_type, data1, data2, data3, data4)) #if using USB serial
     except Exception as e:
         _, err, _ = sys.exc_info()
         print("ERROR: Uart error Pico send_uart:", e)
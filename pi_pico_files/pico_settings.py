@@ -19,6 +19,7 @@ PI_ZERO_HEARTBEAT_TIMEOUT = 30 # must be greater than the heartbeat interval on
 UART_TIMEOUT = 0.1
 UART_BUFFER_SIZE = 6 # Larger number means more smoothing, but also lag
 UART_SEND_INTERVAL = 0.05 # Prevent flooding the UART with commands
+UART_BINARY_PROTOCOL = True # Send binary frames once the Pi Zero offers them, CSV lines until then. False keeps to CSV lines. Both are always accepted
 
 
 #LED related:
@@ -0,0 +1,211 @@
+#This code goes onto the Pi Pico, the Pi Zero imports it from the pi_pico_files folder
+# UART framing shared by the Pi Zero and the Pi Pico
+# Binary frame: sync byte, version, sequence number, message type, payload length, payload, CRC-16 of the bytes
+# from the version to the end of the payload. Motor, volume and button messages have fixed size binary fields,
+# the other messages carry their CSV fields as text. CSV lines are always accepted.
+# Each side sends CSV lines until the other has shown it reads frames, by sending one or by offering them in its
+# CSV heartbeats, so either side can be updated first. A peer that stops offering them gets CSV again.
+import struct
+
+SYNC = 0xA5
+VERSION = 1
+HEADER_FORMAT = "<BBBBB"
+HEADER_SIZE = 5
+CRC_SIZE = 2
+MAX_PAYLOAD_SIZE = 255
+MAX_LINE_LENGTH = 1024
+BINARY_OFFER = "binary"  # Field added to CSV heartbeats by a side that reads frames, older code ignores extra fields
+# CircuitPython raises ValueError for struct errors and has no struct.error
+STRUCT_ERRORS = (IndexError, ValueError, OverflowError) + ((struct.error,) if hasattr(struct, "error") else ())
+
+# Message type to (struct format, scale of each field), the fields are sent as scaled integers
+BINARY_FIELDS = {
+    "M": ("<h", (10,)),  # Angle, tenths of a degree
+    "V": ("<H", (1000,)),  # Volume from 0 to 1, thousandths
+    "B": ("<BB", (1, 1)),  # 1 for a press or 2 for a hold, button number
+}
+# Frames with binary fields use the lower case letter as their type byte
+BINARY_TYPES = {ord(command_type.lower()): (command_type, field_format, scales) for command_type, (field_format, scales) in BINARY_FIELDS.items()}
+SYNC_BYTE = bytes([SYNC])
+
+
+def _make_crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table.append(crc & 0xFFFF)
+    return table
+
+
+CRC_TABLE = _make_crc_table()
+
+
+def crc16(data, start=0, end=None):
+    """
+    CRC-16/CCITT-FALSE of data[start:end].
+    """
+    crc = 0xFFFF
+    for index in range(start, len(data) if end is None else end):
+        crc = ((crc << 8) & 0xFFFF) ^ CRC_TABLE[((crc >> 8) ^ data[index]) & 0xFF]
+    return crc
+
+
+try:
+    from binascii import crc_hqx  # Same CRC in C on the Pi Zero, CircuitPython doesn't have it
+
+    def crc16(data, start=0, end=None):
+        return crc_hqx(memoryview(data)[start:end], 0xFFFF)
+except ImportError:
+    pass
+
+
+def is_valid_frame(buffer, position):
+    """
+    True if buffer holds a whole frame starting at position with the right version and CRC.
+    """
+    if len(buffer) - position < HEADER_SIZE or buffer[position + 1] != VERSION:
+        return False
+    payload_end = position + HEADER_SIZE + buffer[position + 4]
+    if len(buffer) < payload_end + CRC_SIZE:
+        return False
+    return struct.unpack_from("<H", buffer, payload_end)[0] == crc16(buffer, position + 1, payload_end)
+
+
+def format_number(value):
+    # Whole numbers are sent back as "3" rather than "3.0", like the CSV messages
+    return str(int(value)) if value == int(value) else str(value)
+
+
+class UartProtocol:
+    """
+    Encodes outgoing messages and splits incoming bytes into messages for one side of the link.
+    Messages are lists of text fields, the same as a split CSV line, so the message handlers work with either format.
+    """
+
+    def __init__(self, binary=True):
+        self.binary = binary  # Frames are allowed, they are only sent once peer_binary is set
+        self.peer_binary = False
+        self.send_sequence = 0
+        self.receive_sequence = None
+        self.buffer = b""
+        self.frames = 0
+        self.csv_lines = 0
+        self.crc_errors = 0
+        self.lost_frames = 0
+
+    def encode(self, command_type, *data):
+        """
+        Returns the bytes to send for a message, a binary frame or a CSV line.
+        """
+        if not (self.binary and self.peer_binary):
+            if self.binary and command_type == "H" and not any(data[1:]):
+                data = (data[0], BINARY_OFFER)  # Tell the other side it can send frames
+            return bytes(",".join([command_type] + [str(field) for field in data] + [""] * (4 - len(data))) + ",\n", "utf-8")
+        payload = None
+        if command_type in BINARY_FIELDS:
+            field_format, scales = BINARY_FIELDS[command_type]
+            try:
+                payload = struct.pack(field_format, *[round(float(data[index]) * scale) for index, scale in enumerate(scales)])
+            except STRUCT_ERRORS:
+                payload = None  # Fields that don't fit the binary layout are sent as text
+            if payload is not None:
+                command_type = command_type.lower()  # Lower case types carry binary fields
+        if payload is None:
+            fields = [str(field) for field in data]
+            while fields and not fields[-1]:
+                fields.pop()  # The CSV padding isn't needed, the frame has a length
+            payload = bytes(",".join(fields), "utf-8")
+            if len(payload) > MAX_PAYLOAD_SIZE:
+                # Cut at a character boundary, UTF-8 continuation bytes start with the bits 10
+                end = MAX_PAYLOAD_SIZE
+                while end and payload[end] & 0xC0 == 0x80:
+                    end -= 1
+                payload = payload[:end]
+        frame = bytearray(struct.pack(HEADER_FORMAT, SYNC, VERSION, self.send_sequence, ord(command_type), len(payload)))
+        frame += payload
+        frame += struct.pack("<H", crc16(frame, 1))
+        self.send_sequence = (self.send_sequence + 1) & 0xFF
+        return bytes(frame)
+
+    def feed(self, data):
+        """
+        Add received bytes, returns the complete messages found in them.
+        The bytes are searched as bytes, CircuitPython's bytearray has no find().
+        """
+        buffer = self.buffer + bytes(data)
+        position = 0
+        messages = []
+        while position < len(buffer):
+            if buffer[position] != SYNC:
+                # CSV line, or the bytes of a damaged frame. 0xA5 is also a byte of UTF-8 text such as "¥",
+                # so a sync byte inside a line only ends it if a whole frame with a good CRC starts there.
+                line_end = buffer.find(b"\n", position)
+                sync_start = buffer.find(SYNC_BYTE, position)
+                while sync_start >= 0 and (line_end < 0 or sync_start < line_end):
+                    if is_valid_frame(buffer, sync_start):
+                        break
+                    sync_start = buffer.find(SYNC_BYTE, sync_start + 1)
+                if sync_start >= 0 and (line_end < 0 or sync_start < line_end):
+                    position = sync_start
+                    continue
+                if line_end < 0:
+                    if len(buffer) - position > MAX_LINE_LENGTH:
+                        position = len(buffer)
+                    break
+                message = self.decode_line(buffer[position:line_end])
+                position = line_end + 1
+                if message:
+                    self.csv_lines += 1
+                    messages.append(message)
+                continue
+
+            if len(buffer) - position < HEADER_SIZE:
+                break
+            sync, version, sequence, command_type, length = struct.unpack_from(HEADER_FORMAT, buffer, position)
+            payload_end = position + HEADER_SIZE + length
+            if len(buffer) < payload_end + CRC_SIZE:
+                break
+            if version != VERSION or struct.unpack_from("<H", buffer, payload_end)[0] != crc16(buffer, position + 1, payload_end):
+                self.crc_errors += 1
+                position += 1  # Look for the next sync byte
+                continue
+            message = self.decode_payload(command_type, buffer[position + HEADER_SIZE:payload_end])
+            position = payload_end + CRC_SIZE
+            if self.receive_sequence is not None:
+                self.lost_frames += (sequence - self.receive_sequence - 1) & 0xFF
+            self.receive_sequence = sequence
+            self.frames += 1
+            self.peer_binary = True  # A side that sends frames reads them
+            if message:
+                messages.append(message)
+        # Only the unfinished message is kept, the buffer is copied once per read
+        self.buffer = buffer[position:]
+        return messages
+
+    def decode_payload(self, command_type, payload):
+        if command_type in BINARY_TYPES:
+            command_type, field_format, scales = BINARY_TYPES[command_type]
+            try:
+                values = struct.unpack(field_format, payload)
+            except STRUCT_ERRORS:
+                return None
+            return [command_type] + [format_number(value / scale) if scale != 1 else str(value) for value, scale in zip(values, scales)]
+        try:
+            return [chr(command_type)] + payload.decode("utf-8").split(",")
+        except UnicodeError:
+            return None
+
+    def decode_line(self, line):
+        # CSV lines start with a message type letter and a comma, anything else is noise
+        try:
+            line = line.decode("utf-8").strip("\r")
+        except UnicodeError:
+            return None
+        if len(line) < 2 or line[1] != "," or not line[0].isalpha():
+            return None
+        message = line.split(",")
+        if message[0] == "H":
+            self.peer_binary = BINARY_OFFER in message[2:]
+        return message
@@ -0,0 +1,98 @@
+# Licence: Attribution-NonCommercial-ShareAlike 4.0 International (CC BY-NC-SA 4.0) Written by ZapWizard (Joshua Driggs)
+
+# Song prefetcher
+# Reads part of an upcoming song into the page cache from a background thread, a little before it is needed,
+# so opening it on the audio path doesn't wait on the SD card.
+import os
+import threading
+import time
+from collections import OrderedDict
+
+WARM_FILES_KEPT = 16  # Recently warmed files remembered for the hit and miss counters
+PAGE_SIZE = 4096
+
+
+class Prefetcher(threading.Thread):
+    """
+    Warms files in due time order. Requests are keyed by what they are for, such as the next song or a station
+    ahead of the needle, and a new request replaces a waiting one with the same key.
+    """
+
+    def __init__(self, read_bytes, chunk_size=65536):
+        super(Prefetcher, self).__init__(name="prefetcher", daemon=True)
+        self.read_bytes = read_bytes
+        self.chunk_size = chunk_size
+        self.condition = threading.Condition()
+        self.pending = {}  # Key to (due time, file path, start fraction)
+        self.warm_files = OrderedDict()  # File path to the time it took to warm
+        self.hits = 0
+        self.misses = 0
+
+    def schedule(self, key, file_path, due_time=0, start_fraction=0):
+        """
+        Warm read_bytes of file_path at due_time, starting start_fraction of the way into the file.
+        """
+        with self.condition:
+            self.pending[key] = (due_time, file_path, start_fraction)
+            self.condition.notify()
+
+    def run(self):
+        try:
+            # Linux applies the nice value to this thread only
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+        except (AttributeError, OSError) as error:
+            print(f"Warning: Could not lower the prefetcher priority: {error}")
+
+        while True:
+            with self.condition:
+                if not self.pending:
+                    self.condition.wait()
+                    continue
+                key = min(self.pending, key=lambda pending_key: self.pending[pending_key][0])
+                due_time, file_path, start_fraction = self.pending[key]
+                delay = due_time - time.time()
+                if delay > 0:
+                    self.condition.wait(delay)  # Wakes up early if another file is scheduled
+                    continue
+                del self.pending[key]
+            self.warm_file(file_path, start_fraction)
+
+    def warm_file(self, file_path, start_fraction=0):
+        start_time = time.time()
+        try:
+            with open(file_path, 'rb', buffering=0) as file:
+                file_size = os.fstat(file.fileno()).st_size
+                # Audio is read from the page before the estimated position, the estimate assumes a constant bitrate
+                offset = max(int(file_size * start_fraction) - self.chunk_size, 0) // PAGE_SIZE * PAGE_SIZE
+                if hasattr(os, "posix_fadvise"):
+                    # Lets the kernel read ahead in large requests while the loop below waits for the first chunks
+                    os.posix_fadvise(file.fileno(), offset, self.read_bytes, os.POSIX_FADV_WILLNEED)
+                file.seek(offset)
+                bytes_left = self.read_bytes
+                while bytes_left > 0:
+                    data = file.read(min(self.chunk_size, bytes_left))
+                    if not data:
+                        break
+                    bytes_left -= len(data)
+        except OSError as error:
+            print(f"Warning: Prefetch of {file_path} failed: {error}")
+            return
+        warm_time = time.time() - start_time
+        with self.condition:
+            self.warm_files[file_path] = warm_time
+            self.warm_files.move_to_end(file_path)
+            while len(self.warm_files) > WARM_FILES_KEPT:
+                self.warm_files.popitem(last=False)
+        print(f"Prefetch: Warmed {os.path.basename(file_path)} from byte {offset} in {round(warm_time * 1000, 1)} ms")
+
+    def check_hit(self, file_path):
+        """
+        Count a song start as a hit if its file was warmed beforehand, returns True for a hit.
+        """
+        with self.condition:
+            hit = file_path in self.warm_files
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return hit
@@ -3,6 +3,7 @@ import pygame
 # File paths
 SAVE_FILE = "saved.ini"
 STATIONS_ROOT_FOLDER = "radio/"
+LIBRARY_INDEX_FILE = "radio/library.json" # Single file cache of every band, station and song length
 STATIC_SOUNDS_FOLDER = "sounds/STATIC_SOUNDS_FOLDER"
 STATIC_PRELOAD_NUM = 6 #Control the number of preloaded static files
 PICO_SOURCE = "pi_pico_files/"
@@ -36,22 +37,60 @@ BAND_CALLOUT_SETTINGS = {
     "file": "callout.ogg",
     "wait_for_completion": True,
 }
+SOUND_CACHE_SETTINGS = {
+    "budget": 16 * 2 ** 20, # Bytes of decoded sound kept in memory, a second of audio takes 172 KB
+    "preload_callouts": True, # Decode every band callout in the background after startup
+}
+PLAYBACK_SETTINGS = {
+    "gapless": True, # Queue the next song in the mixer so it starts the moment the current one ends
+    "measure_gaps": False, # Print the silence from each song's end event to the mixer playing the next, to compare with gapless set to False
+}
+PREFETCH_SETTINGS = {
+    "enabled": True,
+    "lead_time": 10, # Seconds before the end of a song that the start of the next song is read into the page cache
+    "read_bytes": 262144, # How much of the next song is read, a few seconds of audio
+}
+PREWARM_SETTINGS = {
+    "enabled": True,
+    "stations_ahead": 2, # Stations ahead of a moving needle that are read into the page cache
+    "min_speed": 2, # Degrees per second, a slower needle is treated as standing still
+}
+SEEK_TABLE_SETTINGS = {
+    "min_length": 600, # Seconds, the indexer builds seek tables for files at least this long
+    "interval": 5, # Seconds between seek table entries, playback can start up to this much before the live position
+    "direct_start": True, # Start long files at the page from the seek table instead of letting the decoder search for it
+}
 
 # To speed up the boot process: Song and station data caching is used
-# The code will try to detect if the song files change, but if it fails to do so
-# you must set the value of RESET_CACHE to True and then reboot
-# Depending on the size of your music library caching can take a very long time
-# Once the cache is re-built the radio will operate as normal
-# The RESET_CACHE settings must be set to False before your the next reboot
-# You can optionally reset the cache on any single folder by deleting the [CACHE] section inside the station.ini file.
+# At boot the size, modification time and inode of every file are compared with the library index. Only files
+# that are new or changed, including files overwritten in place, are probed, so this is quick even for large folders.
+# Set RESET_CACHE to True and reboot to rescan every folder, it should be set to False before your the next reboot
+# Song data is kept in the LIBRARY_INDEX_FILE. Deleting that file forces every song to be probed again,
+# depending on the size of your music library this can take a very long time.
 RESET_CACHE = False
 
+# Library scanning
+SCAN_SETTINGS = {
+    "workers": 4, # Files probed in parallel across the whole library, SD cards gain little from more
+    "warmup_delay": 10, # Seconds after startup before the other bands are loaded in the background
+}
+
+# Live library watcher, picks up music copied onto the radio without a restart
+WATCHER_SETTINGS = {
+    "enabled": True,
+    "use_inotify": True, # Falls back to polling when inotify isn't available
+    "debounce": 2, # Seconds without changes before the changed folders are rescanned
+    "max_delay": 30, # Rescan at least this often during a long copy
+    "poll_interval": 5, # Seconds between folder checks when polling
+}
+
 # Radio tuning
 TUNING_SETTINGS = {
     "near": 8, # Angular distance at which static will start playing at the same time as the station
     "lock_on": 2, # Angular distance at which the station will play in the clear
     "end_zone": 14, # Dead zones to ensure that a station isn't at the very ends of the dial
     "sweep_enabled": False, #Enable a sweeping effect at band changes
+    "table_step": 0.1, # Degrees between tuning table entries, the Pi Pico sends angles rounded to 0.1
 }
 
 # Motor settings
@@ -74,6 +113,8 @@ UART_SETTINGS = {
     "heartbeat_interval": 2,
     "heartbeat_timeout": 30,
     "serial_port": "/dev/ttyACM1",
+    "measure_latency": False, # Print the time from a motor message to the tuning change
+    "binary_protocol": True, # Send binary frames with a CRC once the Pi Pico offers them, False keeps to CSV lines. Both are always accepted
 }
 
 # Events
@@ -81,12 +122,26 @@ EVENTS = {
     "BLINK": pygame.USEREVENT + 1,
     "SONG_END": pygame.USEREVENT + 2,
     "PLAYPAUSE": pygame.USEREVENT + 3,
+    "LIBRARY_CHANGED": pygame.USEREVENT + 4,
+    "CALLOUT_END": pygame.USEREVENT + 5,
+    "UART_MESSAGE": pygame.USEREVENT + 6,
+    "STATIC_END": pygame.USEREVENT + 7,
 }
 
 # Miscellaneous
 TICK = 200 # Max rate of the code loop, loops per second
+LOOP_STALL_WARNING = 0.05 # Seconds, loops that take longer are reported
+MAIN_LOOP_SETTINGS = {
+    "event_driven": True, # Sleep until an event, a UART message or a timer is due, False runs the loop TICK times a second
+    "max_sleep": 1, # Seconds, the longest the loop sleeps without an event
+    "gpio_poll_interval": 0.05, # Seconds, GPIO inputs are polled, so the loop sleeps less when they are used
+    "runtime": "loop", # "asyncio" runs heartbeats, the Pi Pico timeout, UART reconnection and scheduled jobs as separate tasks
+    "event_poll_interval": 0.02, # Seconds between pygame event checks with the asyncio runtime, UART messages wake it at once
+}
 FAST_FORWARD_INCREMENT = 5  # seconds
 REWIND_INCREMENT = 5  # seconds
+STATION_POOL_SIZE = 4  # Bands whose stations are kept in memory, going back to one of them skips rebuilding its stations
+SHUFFLE_SEED = 0  # Random stations play a new order every day, radios with the same seed play the same order
 TIME_ZONE = "US/Central"
 
 # Pi Pico detection
@@ -0,0 +1,92 @@
+# Licence: Attribution-NonCommercial-ShareAlike 4.0 International (CC BY-NC-SA 4.0) Written by ZapWizard (Joshua Driggs)
+
+# Decoded sound cache
+# pygame.mixer.Sound decodes the whole file into memory, which takes a noticeable time for a band callout.
+# Decoded sounds are kept here up to a memory budget, the least recently used sounds are dropped first.
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pygame
+
+
+class SoundCache:
+    """
+    File path to decoded pygame Sound, shared by the main loop and the preload thread.
+    """
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.lock = threading.Lock()
+        self.sounds = OrderedDict()  # File path to (Sound, size in bytes), least recently used first
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, file_path):
+        """
+        Returns the decoded sound for file_path, decoding it on a miss. pygame errors are passed on.
+        """
+        with self.lock:
+            cached = self.sounds.get(file_path)
+            if cached:
+                self.sounds.move_to_end(file_path)
+                self.hits += 1
+                return cached[0]
+            self.misses += 1
+        return self.load(file_path)
+
+    def load(self, file_path):
+        sound = pygame.mixer.Sound(file_path)
+        size = get_sound_size(sound)
+        with self.lock:
+            if file_path not in self.sounds:
+                self.sounds[file_path] = (sound, size)
+                self.used_bytes += size
+            self.sounds.move_to_end(file_path)
+            while self.used_bytes > self.budget_bytes and len(self.sounds) > 1:
+                evicted_path, (evicted_sound, evicted_size) = self.sounds.popitem(last=False)
+                self.used_bytes -= evicted_size
+                print(f"Sound: Dropped {os.path.basename(evicted_path)} from the cache")
+        return sound
+
+    def preload(self, file_paths, delay=0):
+        """
+        Decode file_paths in a low priority background thread, after delay seconds.
+        """
+        def preload_sounds():
+            time.sleep(delay)
+            try:
+                # Linux applies the nice value to this thread only
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+            except (AttributeError, OSError) as error:
+                print(f"Warning: Could not lower the sound preload priority: {error}")
+            start_time = time.time()
+            for file_path in file_paths:
+                with self.lock:
+                    if file_path in self.sounds:
+                        continue
+                try:
+                    self.load(file_path)
+                except pygame.error as error:
+                    print(f"Warning: Could not decode {file_path}: {error}")
+            print(f"Sound: Preloaded {len(file_paths)} sounds in {round(time.time() - start_time, 2)} s")
+            self.report()
+
+        threading.Thread(target=preload_sounds, name="sound-preload", daemon=True).start()
+
+    def report(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            hit_rate = round(self.hits / lookups * 100) if lookups else 0
+            print(f"Sound: {len(self.sounds)} sounds cached, {round(self.used_bytes / 2 ** 20, 2)} of "
+                  f"{round(self.budget_bytes / 2 ** 20, 2)} MB, {self.hits} hits, {self.misses} misses, {hit_rate}% hit rate")
+
+
+def get_sound_size(sound):
+    """
+    Memory used by a decoded sound, worked out from its length and the mixer format so the samples aren't copied.
+    """
+    frequency, sample_format, channels = pygame.mixer.get_init()
+    return int(sound.get_length() * frequency) * channels * (abs(sample_format) // 8)
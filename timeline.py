@@ -0,0 +1,57 @@
+# Licence: Attribution-NonCommercial-ShareAlike 4.0 International (CC BY-NC-SA 4.0) Written by ZapWizard (Joshua Driggs)
+
+# Station timeline
+# A station plays its songs back to back in a loop. The timeline holds the cumulative start offset of every song,
+# so the song playing at any point of the loop is found with a modulo and a binary search instead of a walk.
+import bisect
+import itertools
+import random
+from array import array
+
+
+class StationTimeline:
+    """
+    Song start offsets for one play order, not changed after construction.
+    offsets[i] is where song i starts, offsets[-1] is the loop length.
+    """
+    __slots__ = ("offsets", "total_length")
+
+    def __init__(self, song_lengths):
+        self.offsets = array('d', itertools.accumulate(song_lengths, initial=0.0))
+        self.total_length = self.offsets[-1]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __eq__(self, other):
+        # Rescanned stations get a new timeline, it only counts as a change if the songs changed
+        return isinstance(other, StationTimeline) and self.offsets == other.offsets
+
+    def song_start(self, index):
+        return self.offsets[index]
+
+    def song_length(self, index):
+        return self.offsets[index + 1] - self.offsets[index]
+
+    def locate(self, position):
+        """
+        Returns (song index, position within that song) for a position in seconds from the start of the loop.
+        Positions past the end wrap around, so any amount of elapsed time costs the same.
+        """
+        if not len(self) or self.total_length <= 0:
+            return 0, 0
+        position = position % self.total_length
+        index = bisect.bisect_right(self.offsets, position) - 1
+        # Zero length songs share an offset with the next song, bisect_right already lands on the last of them
+        index = min(index, len(self) - 1)
+        return index, position - self.offsets[index]
+
+
+def get_shuffled_order(song_count, station_key, day, seed):
+    """
+    Returns a shuffled array of song indexes that only depends on the arguments.
+    String seeds are hashed with SHA-512 by random, so every radio and Python version builds the same order.
+    """
+    play_order = array('I', range(song_count))
+    random.Random(f"{seed}/{day}/{station_key}").shuffle(play_order)
+    return play_order
@@ -0,0 +1,82 @@
+# Licence: Attribution-NonCommercial-ShareAlike 4.0 International (CC BY-NC-SA 4.0) Written by ZapWizard (Joshua Driggs)
+
+# UART reader
+# Reads the Pi Pico's messages in a background thread, so the main loop never waits on the serial port.
+# Bytes are split into binary frames or CSV lines as they arrive and each message is queued with the time it was complete.
+import queue
+import threading
+import time
+
+import serial
+
+
+class UartReader(threading.Thread):
+    """
+    Queues (received time, message fields) for every message read from the port returned by get_port.
+    get_port is called on every read, so a port reopened by the main code is picked up.
+    protocol is the UartProtocol that splits the bytes into messages.
+    on_message is called when a message arrives while the last wake up hasn't been handled, so a sleeping
+    main loop can be woken once per batch instead of once per message.
+    With reopen, a port closed after an error is opened again here, otherwise the reader waits for the main code to.
+    """
+
+    def __init__(self, get_port, protocol, on_message=None, reopen=True):
+        super(UartReader, self).__init__(name="uart-reader", daemon=True)
+        self.get_port = get_port
+        self.protocol = protocol
+        self.on_message = on_message
+        self.reopen = reopen
+        self.wake_pending = False
+        self.messages = queue.Queue()
+
+    def run(self):
+        while True:
+            port = self.get_port()
+            if port is None or (not self.reopen and not port.is_open):
+                time.sleep(0.1)
+                continue
+            try:
+                if not port.is_open:
+                    print("DEBUG: UART is not open. Attempting to reopen.")
+                    port.open()
+                    print("INFO: UART reopened successfully.")
+                # Waits up to the port timeout for the first byte, then takes whatever else has arrived
+                data = port.read(max(port.in_waiting, 1))
+            except serial.SerialException as error:
+                print(f"ERROR: SerialException in the UART reader: {error}")
+                self.close_port(port)
+                time.sleep(0.1)
+                continue
+            except Exception as error:
+                print(f"ERROR: Unexpected error in the UART reader: {error}")
+                self.close_port(port)
+                time.sleep(0.1)
+                continue
+            if data:
+                received_time = time.perf_counter()
+                messages = self.protocol.feed(data)
+                for message in messages:
+                    self.messages.put((received_time, message))
+                if messages and self.on_message and not self.wake_pending:
+                    self.wake_pending = True
+                    self.on_message()
+
+    def get_messages(self):
+        """
+        Returns every queued (received time, message fields), oldest first, without waiting.
+        """
+        self.wake_pending = False  # Cleared before draining, a message queued after this wakes the loop again
+        messages = []
+        while True:
+            try:
+                messages.append(self.messages.get_nowait())
+            except queue.Empty:
+                return messages
+
+    def close_port(self, port):
+        self.protocol.buffer = b""  # A partial message can't be finished after a reset
+        try:
+            port.close()
+            print("INFO: UART closed after exception.")
+        except Exception as close_error:
+            print(f"ERROR: Failed to close UART after exception: {close_error}")
@@ -0,0 +1,217 @@
+# Licence: Attribution-NonCommercial-ShareAlike 4.0 International (CC BY-NC-SA 4.0) Written by ZapWizard (Joshua Driggs)
+
+# Live library watcher
+# Watches the band and station folders for changed files, using inotify on Linux and polling elsewhere.
+# Bursts of changes, such as an rsync of new music, are collected until the folders have been quiet for a moment,
+# then the changed station folders are handed to a callback on the watcher thread.
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+import settings
+
+# inotify constants from <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+INOTIFY_EVENT = struct.Struct("iIII")  # Watch descriptor, mask, cookie, name length
+
+
+def is_library_file(path):
+    name = os.path.basename(path)
+    return name.endswith(".ogg") or name == "station.ini"
+
+
+class LibraryWatcher(threading.Thread):
+    """
+    Calls on_change(station_folders) from the watcher thread with the set of station folders whose files changed.
+    """
+
+    def __init__(self, radio_folder, on_change, use_inotify=settings.WATCHER_SETTINGS["use_inotify"]):
+        super(LibraryWatcher, self).__init__(name="library_watcher", daemon=True)
+        self.radio_folder = radio_folder
+        self.on_change = on_change
+        self.use_inotify = use_inotify
+        self.debounce = settings.WATCHER_SETTINGS["debounce"]
+        self.max_delay = settings.WATCHER_SETTINGS["max_delay"]
+        self.poll_interval = settings.WATCHER_SETTINGS["poll_interval"]
+        self.pending_folders = set()
+        self.first_change_time = None
+        self.last_change_time = None
+        self.stop_requested = False
+        self.libc = None
+        self.inotify_fd = None
+        self.watch_folders = {}  # inotify watch descriptor to folder path
+
+    def stop(self):
+        self.stop_requested = True
+
+    def run(self):
+        if self.use_inotify and self.start_inotify():
+            print("Info: Library watcher using inotify on", self.radio_folder)
+            wait_for_changes = self.read_inotify
+        else:
+            print("Info: Library watcher polling", self.radio_folder, "every", self.poll_interval, "s")
+            self.snapshot = self.take_snapshot()
+            wait_for_changes = self.poll_snapshot
+
+        while not self.stop_requested:
+            try:
+                wait_for_changes()
+                self.flush_changes()
+            except Exception as error:
+                print(f"ERROR: Library watcher: {error}")
+                time.sleep(self.poll_interval)
+
+    def mark_changed(self, station_folder):
+        now = time.time()
+        self.pending_folders.add(os.path.normpath(station_folder))
+        self.last_change_time = now
+        if self.first_change_time is None:
+            self.first_change_time = now
+
+    def flush_changes(self):
+        """
+        Hand over the pending folders once no change has been seen for the debounce time, or max_delay has passed.
+        """
+        if not self.pending_folders:
+            return
+        now = time.time()
+        if now - self.last_change_time < self.debounce and now - self.first_change_time < self.max_delay:
+            return
+        station_folders = self.pending_folders
+        self.pending_folders = set()
+        self.first_change_time = None
+        self.last_change_time = None
+        print(f"Info: Library watcher found changes in {len(station_folders)} station folders")
+        self.on_change(station_folders)
+
+    def get_station_folder(self, path):
+        """
+        Returns the station folder a path belongs to, or None for the radio and band folders themselves.
+        """
+        relative_path = os.path.relpath(path, self.radio_folder)
+        parts = relative_path.split(os.sep)
+        if relative_path == os.curdir or len(parts) < 2:
+            return None
+        return os.path.join(self.radio_folder, parts[0], parts[1])
+
+    # inotify
+    def start_inotify(self):
+        try:
+            self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            self.inotify_fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except (OSError, AttributeError) as error:
+            print(f"Warning: inotify unavailable: {error}")
+            return False
+        if self.inotify_fd < 0:
+            print(f"Warning: inotify_init1 failed: {os.strerror(ctypes.get_errno())}")
+            return False
+
+        # Watch the radio folder, every band folder and every station folder
+        self.add_watch(self.radio_folder)
+        for band_folder in os.scandir(self.radio_folder):
+            if band_folder.is_dir():
+                self.watch_band_folder(band_folder.path)
+        return True
+
+    def watch_band_folder(self, band_folder, mark_changed=False):
+        """
+        Watch a band folder and its station folders. A band folder moved or copied in whole already has
+        its station folders, with mark_changed they are handed over as changed so the new band gets scanned.
+        """
+        self.add_watch(band_folder)
+        try:
+            station_folders = [entry.path for entry in os.scandir(band_folder) if entry.is_dir()]
+        except OSError as error:
+            print(f"Warning: Could not list {band_folder}: {error}")
+            return
+        for station_folder in station_folders:
+            self.add_watch(station_folder)
+            if mark_changed:
+                self.mark_changed(station_folder)
+
+    def add_watch(self, folder):
+        watch_descriptor = self.libc.inotify_add_watch(self.inotify_fd, os.fsencode(folder), WATCH_MASK)
+        if watch_descriptor < 0:
+            print(f"Warning: Could not watch {folder}: {os.strerror(ctypes.get_errno())}")
+            return
+        self.watch_folders[watch_descriptor] = folder
+
+    def read_inotify(self):
+        timeout = self.debounce if self.pending_folders else self.poll_interval
+        readable, _, _ = select.select([self.inotify_fd], [], [], timeout)
+        if not readable:
+            return
+        try:
+            data = os.read(self.inotify_fd, 65536)
+        except BlockingIOError:
+            return
+
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            watch_descriptor, mask, cookie, name_length = INOTIFY_EVENT.unpack_from(data, offset)
+            name = data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + name_length].rstrip(b"\0")
+            offset += INOTIFY_EVENT.size + name_length
+
+            folder = self.watch_folders.get(watch_descriptor)
+            if mask & IN_IGNORED:
+                self.watch_folders.pop(watch_descriptor, None)
+                continue
+            if folder is None or not name:
+                continue
+            path = os.path.join(folder, os.fsdecode(name))
+
+            # Follow new band and station folders
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and self.get_station_folder(folder) is None:
+                if self.get_station_folder(path) is None:
+                    self.watch_band_folder(path, True)
+                else:
+                    self.add_watch(path)
+            station_folder = self.get_station_folder(path)
+            if station_folder and (path == station_folder or is_library_file(path)):
+                self.mark_changed(station_folder)
+
+    # Polling
+    def take_snapshot(self):
+        """
+        Returns the (size, mtime) of every file in every station folder.
+        """
+        snapshot = {}
+        for band_folder in os.scandir(self.radio_folder):
+            if not band_folder.is_dir():
+                continue
+            for station_folder in os.scandir(band_folder.path):
+                if not station_folder.is_dir():
+                    continue
+                files = {}
+                for file in os.scandir(station_folder.path):
+                    if not is_library_file(file.name):
+                        continue
+                    try:
+                        stat_result = file.stat()
+                        files[file.name] = (stat_result.st_size, stat_result.st_mtime_ns)
+                    except OSError:
+                        pass
+                snapshot[station_folder.path] = files
+        return snapshot
+
+    def poll_snapshot(self):
+        time.sleep(self.debounce if self.pending_folders else self.poll_interval)
+        snapshot = self.take_snapshot()
+        for station_folder in set(snapshot) | set(self.snapshot):
+            if snapshot.get(station_folder) != self.snapshot.get(station_folder):
+                self.mark_changed(station_folder)
+        self.snapshot = snapshot